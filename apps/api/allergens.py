@@ -0,0 +1,219 @@
+# Profile-agnostic allergen tagging and the per-profile overlay.
+#
+# Parsing extracts items and icons once per menu; everything user-specific happens here, against
+# the stored pages, so a single parse can serve any number of diners.
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+ALLERGEN_LABELS = ["peanut", "tree_nut", "shellfish", "egg", "dairy", "gluten"]
+DIET_LABELS = ["vegan", "vegetarian"]
+ICON_LABELS = ALLERGEN_LABELS + DIET_LABELS + ["spicy"]  # mirrors PARSE_SCHEMA's icon enum
+
+# What diners type in their profile → icon label
+PROFILE_ALIASES: Dict[str, str] = {
+    "peanut": "peanut", "peanuts": "peanut", "groundnut": "peanut",
+    "tree nut": "tree_nut", "tree nuts": "tree_nut",
+    "shellfish": "shellfish", "crustacean": "shellfish", "crustaceans": "shellfish",
+    "egg": "egg", "eggs": "egg",
+    "dairy": "dairy", "milk": "dairy", "lactose": "dairy",
+    "gluten": "gluten", "wheat": "gluten", "celiac": "gluten", "coeliac": "gluten",
+    "vegan": "vegan", "vegetarian": "vegetarian", "spicy": "spicy",
+}
+# Generic terms covering several labels: a "nut" allergy has to avoid peanuts as well
+PROFILE_GROUPS: Dict[str, List[str]] = {
+    "nut": ["peanut", "tree_nut"], "nuts": ["peanut", "tree_nut"],
+}
+
+# Ingredient lexicon per label: synonyms and derivative forms, matched as whole (stemmed) words
+# so "croutons" → crouton → gluten but "eggplant" never matches egg.
+LEXICON: Dict[str, List[str]] = {
+    "peanut": ["peanut", "groundnut", "goober", "satay", "arachis", "monkey nut"],
+    "tree_nut": [
+        "almond", "cashew", "walnut", "pecan", "pistachio", "hazelnut", "filbert", "macadamia", "pine nut",
+        "brazil nut", "chestnut", "praline", "marzipan", "frangipane", "gianduja", "nutella", "pesto",
+        "amaretto", "nougat", "tree nut", "mixed nut",
+    ],
+    "shellfish": [
+        "shrimp", "prawn", "crab", "lobster", "crayfish", "crawfish", "langoustine", "scampi", "scallop",
+        "clam", "mussel", "oyster", "krill", "shellfish", "calamari", "squid", "octopus", "cockle", "surimi",
+    ],
+    "egg": [
+        "egg", "yolk", "albumen", "mayonnaise", "mayo", "aioli", "meringue", "hollandaise", "bearnaise",
+        "custard", "frittata", "omelet", "omelette", "quiche", "carbonara", "caesar dressing", "brioche",
+        "challah", "eggnog",
+    ],
+    "dairy": [
+        "milk", "cheese", "butter", "buttermilk", "cream", "yogurt", "yoghurt", "ghee", "whey", "casein",
+        "lactose", "curd", "kefir", "parmesan", "parm", "parmigiano", "pecorino", "mozzarella", "burrata", "ricotta",
+        "mascarpone", "cheddar", "feta", "gouda", "brie", "camembert", "gruyere", "halloumi", "paneer",
+        "queso", "alfredo", "bechamel", "custard", "gelato", "ice cream", "creme fraiche", "tzatziki", "raita",
+        "buttery", "buttered", "cheesy", "creamy", "creamed", "caesar dressing", "ranch",
+    ],
+    "gluten": [
+        "wheat", "flour", "bread", "breadcrumb", "crouton", "pasta", "noodle", "spaghetti", "linguine",
+        "fettuccine", "penne", "ravioli", "lasagna", "lasagne", "gnocchi", "couscous", "bulgur", "semolina",
+        "durum", "farro", "spelt", "barley", "rye", "malt", "seitan", "panko", "tempura", "batter", "battered",
+        "breaded", "pita", "naan", "tortilla", "bun", "roll", "brioche", "croissant", "pastry", "pie crust",
+        "dumpling", "wonton", "udon", "ramen", "soy sauce", "teriyaki", "beer", "cake", "cookie", "biscuit",
+        "cracker", "pizza", "focaccia", "baguette", "sourdough", "challah",
+    ],
+}
+
+# Phrases that contain a trigger word but are not that allergen
+EXCLUSIONS: Dict[str, List[str]] = {
+    "dairy": [
+        "peanut butter", "almond butter", "cashew butter", "nut butter", "cocoa butter", "shea butter",
+        "apple butter", "coconut milk", "coconut cream", "almond milk", "oat milk", "soy milk", "rice milk",
+        "cream of tartar", "dairy free", "vegan cheese", "vegan butter",
+    ],
+    "gluten": ["buckwheat", "gluten free", "rice noodle", "rice flour", "corn tortilla", "rice paper roll", "tamari"],
+    "egg": ["egg free", "eggless", "vegan mayo", "vegan mayonnaise"],
+    "tree_nut": ["nutmeg", "water chestnut", "coconut"],
+    "peanut": ["peanut free"],
+}
+
+# Terms that rule an item out of a vegetarian / vegan diet
+NON_VEGETARIAN = [
+    "meat", "beef", "steak", "veal", "pork", "bacon", "ham", "prosciutto", "pancetta", "sausage", "salami",
+    "pepperoni", "chorizo", "lamb", "mutton", "goat", "chicken", "turkey", "duck", "goose", "venison",
+    "fish", "salmon", "tuna", "cod", "halibut", "tilapia", "trout", "anchovy", "sardine", "mackerel",
+    "gelatin", "lard", "bone broth", "chicken stock", "beef stock", "fish sauce", "oyster sauce",
+]
+NON_VEGAN_EXTRA = ["honey"]
+
+def stem(word: str) -> str:
+    if len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("oes") or word.endswith(("ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+def tokens(text: str) -> List[str]:
+    ascii_text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+    return [stem(w) for w in re.findall(r"[a-z0-9]+", ascii_text)]
+
+def _phrases(terms: Iterable[str]) -> List[Tuple[str, ...]]:
+    return [tuple(tokens(t)) for t in terms]
+
+_LEXICON_PHRASES = {label: _phrases(terms) for label, terms in LEXICON.items()}
+_EXCLUSION_PHRASES = {label: _phrases(terms) for label, terms in EXCLUSIONS.items()}
+_MEAT_PHRASES = _phrases(NON_VEGETARIAN)
+_NON_VEGAN_PHRASES = _phrases(NON_VEGAN_EXTRA)
+
+def _find(seq: List[str], phrase: Tuple[str, ...]) -> int:
+    n = len(phrase)
+    for i in range(len(seq) - n + 1):
+        if tuple(seq[i:i + n]) == phrase:
+            return i
+    return -1
+
+def _contains(seq: List[str], phrases: List[Tuple[str, ...]], exclusions: List[Tuple[str, ...]] = ()) -> bool:
+    if exclusions:
+        seq = list(seq)
+        for ex in exclusions:
+            i = _find(seq, ex)
+            while i >= 0:
+                seq[i:i + len(ex)] = ["_"]
+                i = _find(seq, ex)
+    return any(_find(seq, p) >= 0 for p in phrases)
+
+def labels_in_text(text: str) -> Set[str]:
+    seq = tokens(text)
+    return {label for label, phrases in _LEXICON_PHRASES.items() if _contains(seq, phrases, _EXCLUSION_PHRASES.get(label, []))}
+
+def is_meat(text: str) -> bool:
+    return _contains(tokens(text), _MEAT_PHRASES)
+
+def is_non_vegan_extra(text: str) -> bool:
+    return _contains(tokens(text), _NON_VEGAN_PHRASES)
+
+def canonical_labels(term: str) -> List[str]:
+    # Every icon label a profile term stands for; empty when the term is not recognized
+    key = term.strip().lower().replace("-", " ").replace("_", " ")
+    if key.endswith(" free"):  # a "gluten-free" diet avoids the gluten label
+        return [label for label in canonical_labels(key[:-len(" free")]) if label in ALLERGEN_LABELS]
+    if key in PROFILE_GROUPS:
+        return PROFILE_GROUPS[key]
+    label = PROFILE_ALIASES.get(key)
+    return [label] if label else []
+
+def _overlaps_row(item_bbox: List[float], icon_bbox: List[float]) -> bool:
+    # An icon belongs to an item when it sits on the item's line(s) and not far to either side
+    if len(item_bbox) != 4 or len(icon_bbox) != 4:
+        return False
+    ix1, iy1, ix2, iy2 = item_bbox
+    cx1, cy1, cx2, cy2 = icon_bbox
+    overlap = min(iy2, cy2) - max(iy1, cy1)
+    if overlap <= 0 or overlap < 0.5 * max(1.0, cy2 - cy1):
+        return False
+    reach = max(1.0, ix2 - ix1)
+    return cx2 >= ix1 - reach and cx1 <= ix2 + reach
+
+def icons_for_item(item: Dict[str, Any], icons: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [icon for icon in icons if _overlaps_row(item.get("bbox") or [], icon.get("bbox") or [])]
+
+def ingredient_labels(ingredients: Iterable[str]) -> Dict[str, List[str]]:
+    # label → ingredients that triggered it
+    found: Dict[str, List[str]] = {}
+    for ing in ingredients:
+        for label in labels_in_text(ing):
+            found.setdefault(label, []).append(ing)
+    return found
+
+def item_tags(item: Dict[str, Any], icons: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    # The dish name counts as evidence too: "Chicken Satay" implies peanut even if it isn't listed
+    from_ingredients = ingredient_labels([item.get("name") or ""] + list(item.get("ingredients") or []))
+    from_icons: Set[str] = {icon["label"] for icon in icons_for_item(item, icons) if icon.get("label")}
+    diets = from_icons & set(DIET_LABELS)
+    if "vegan" in diets:
+        diets.add("vegetarian")
+    return {
+        "allergens": sorted(set(from_ingredients) | (from_icons & set(ALLERGEN_LABELS))),
+        "diets": sorted(diets),
+        "evidence": from_ingredients,
+        "icons": sorted(from_icons),
+    }
+
+def overlay_profile(parsed_pages: List[Dict[str, Any]], allergens: List[str], diets: List[str] = None) -> Dict[str, Any]:
+    wanted = {}
+    unrecognized = []
+    for term in allergens:
+        labels = [label for label in canonical_labels(term) if label in ALLERGEN_LABELS]
+        for label in labels:
+            wanted[label] = term
+        if not labels and term.strip():
+            unrecognized.append(term.strip().lower())
+    wanted_diets = []
+    for term in diets or []:
+        for label in canonical_labels(term):
+            if label in DIET_LABELS and label not in wanted_diets:
+                wanted_diets.append(label)
+            elif label in ALLERGEN_LABELS:
+                wanted.setdefault(label, term)
+
+    flagged: List[Dict[str, Any]] = []
+    for page in parsed_pages:
+        icons = page.get("icons") or []
+        for item in page.get("items") or []:
+            tags = item_tags(item, icons)
+            hits = [label for label in tags["allergens"] if label in wanted]
+            # Allergens we have no label for fall back to a literal match on the item text
+            text = " ".join([item.get("name") or ""] + list(item.get("ingredients") or [])).lower()
+            hits += [term for term in unrecognized if term in text or term.rstrip("s") in text]
+            missing_diets = [d for d in wanted_diets if d not in tags["diets"]]
+            if not hits and not missing_diets:
+                continue
+            flagged.append({
+                "page": page.get("page"),
+                "name": item.get("name"),
+                "bbox": item.get("bbox"),
+                "allergens": hits,
+                "unconfirmed_diets": missing_diets,
+                "evidence": {label: tags["evidence"].get(label, []) for label in hits if label in tags["evidence"]},
+            })
+    return {"flagged": flagged, "unrecognized_allergens": unrecognized}
@@ -0,0 +1,81 @@
+# Memoized /qa answers, keyed by menu parse version, normalized question and canonical profile.
+# LRU with a TTL; a re-parse drops every entry for that menu.
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+from allergens import canonical_labels
+
+def normalize_question(question: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+def canonical_profile(allergens: List[str], diets: List[str], sodium_limit: Optional[int]) -> Tuple:
+    def canon(terms: List[str]) -> Tuple[str, ...]:
+        return tuple(sorted({l for t in terms if t.strip() for l in canonical_labels(t) or [t.strip().lower()]}))
+    return canon(allergens), canon(diets), sodium_limit
+
+class AnswerCache:
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 900.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._by_menu: Dict[str, Set[Hashable]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(menu_id: str, version: int, question: str, profile: Tuple) -> Tuple:
+        return (menu_id, version, normalize_question(question), profile)
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Tuple, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            self._by_menu.setdefault(key[0], set()).add(key)
+            while len(self._data) > self.max_entries:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+
+    def invalidate(self, menu_id: str) -> int:
+        with self._lock:
+            keys = self._by_menu.pop(menu_id, set())
+            for key in keys:
+                self._data.pop(key, None)
+            return len(keys)
+
+    def _drop(self, key: Tuple) -> None:
+        self._data.pop(key, None)
+        keys = self._by_menu.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_menu[key[0]]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
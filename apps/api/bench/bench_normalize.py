@@ -0,0 +1,67 @@
+# Report vision payload bytes saved and normalization latency per page.
+#
+#   python bench/bench_normalize.py menu.pdf photo.png [--max-edge 2048] [--target-bytes 1000000] [--crop]
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image  # noqa: E402
+
+from imaging import normalize_image  # noqa: E402
+
+def baseline_bytes(img: Image.Image, is_pdf: bool, raw: bytes) -> int:
+    # What the API sent before normalization: raw upload bytes, or a q92 JPEG for PDF pages
+    if not is_pdf:
+        return len(raw)
+    buf = BytesIO()
+    img.convert("RGB").save(buf, format="JPEG", quality=92)
+    return buf.tell()
+
+def iter_pages(path: str):
+    if path.lower().endswith(".pdf"):
+        from pdf2image import convert_from_path
+        for i, img in enumerate(convert_from_path(path, dpi=200), start=1):
+            yield i, img, True, b""
+    else:
+        with open(path, "rb") as f:
+            raw = f.read()
+        img = Image.open(BytesIO(raw))
+        img.load()
+        yield 1, img, False, raw
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("paths", nargs="+")
+    ap.add_argument("--max-edge", type=int, default=2048)
+    ap.add_argument("--target-bytes", type=int, default=1_000_000)
+    ap.add_argument("--crop", action="store_true")
+    args = ap.parse_args()
+
+    total_before = total_after = 0
+    total_ms = 0.0
+    print(f"{'file':30} {'page':>4} {'before':>10} {'after':>10} {'saved':>7} {'ms':>8}  size")
+    for path in args.paths:
+        for page_no, img, is_pdf, raw in iter_pages(path):
+            before = baseline_bytes(img, is_pdf, raw)
+            t0 = time.perf_counter()
+            norm = normalize_image(img, max_edge=args.max_edge, target_bytes=args.target_bytes, crop_margins=args.crop)
+            ms = (time.perf_counter() - t0) * 1000
+            after = len(norm.data)
+            total_before += before
+            total_after += after
+            total_ms += ms
+            saved = 100 * (1 - after / before) if before else 0.0
+            print(f"{os.path.basename(path)[:30]:30} {page_no:>4} {before:>10} {after:>10} {saved:>6.1f}% {ms:>8.1f}  "
+                  f"{norm.original_size[0]}x{norm.original_size[1]} → {norm.size[0]}x{norm.size[1]}")
+
+    if total_before:
+        print(f"\ntotal: {total_before} → {total_after} bytes ({100 * (1 - total_after / total_before):.1f}% saved), "
+              f"{total_ms:.1f} ms normalizing")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+# Cold-start budget check: time `import main` in fresh interpreters and fail when the median
+# exceeds the budget, or when a dependency that must load lazily (openai, pdf2image) is
+# imported at start-up. Exit status 1 on failure, so CI can run it as a gate.
+#
+#   python bench/import_time.py [--budget-ms 750] [--runs 5] [--top 10]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.dirname(HERE)
+
+LAZY_MODULES = ("openai", "pdf2image")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+def probe_env(workdir: str) -> dict:
+    # Real mode without a key: the path a fresh container takes before secrets are checked
+    env = dict(os.environ, AI_MODE="real", MENU_STORE_PATH=os.path.join(workdir, "menus.db"),
+               PARSE_CACHE_DIR=os.path.join(workdir, "parse_cache"), LOG_LEVEL="CRITICAL")
+    env.pop("OPENAI_API_KEY", None)
+    return env
+
+def measure(env: dict) -> dict:
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=API_DIR, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def slowest_imports(env: dict, top: int) -> list:
+    # (cumulative µs, module) for what main imports directly, from -X importtime. Nested imports
+    # are indented one more level and listed before the module that imported them.
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=API_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    children = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative), name.strip()))
+        elif depth == 0:
+            if name.strip() == "main":
+                return sorted(children, reverse=True)[:top]
+            children = []
+    return []
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--budget-ms", type=float, default=750.0, help="maximum median import time")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=10, help="list the slowest modules imported by main")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="allerlens-import-") as workdir:
+        env = probe_env(workdir)
+        results = [measure(env) for _ in range(args.runs)]
+        slowest = slowest_imports(env, args.top) if args.top else []
+
+    times_ms = [r["seconds"] * 1000 for r in results]
+    median = statistics.median(times_ms)
+    loaded = sorted({m for r in results for m in r["loaded"]})
+    print(f"import main: median {median:.0f} ms, min {min(times_ms):.0f} ms, max {max(times_ms):.0f} ms "
+          f"over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    for micros, name in slowest:
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+    ok = True
+    if median > args.budget_ms:
+        print(f"FAIL: median import time {median:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+        ok = False
+    if loaded:
+        print(f"FAIL: imported at start-up but should load lazily: {', '.join(loaded)}")
+        ok = False
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,267 @@
+# Drive upload → parse → qa flows against the API at a fixed concurrency and report p50/p95/p99
+# latency per request type plus requests/second. With --spawn it starts bench/openai_stub.py and
+# the real app under uvicorn itself, so it runs offline with no API key (e.g. in CI).
+#
+#   python bench/load_test.py --spawn --flows 200 --concurrency 16 --stub-latency-ms 300
+#   python bench/load_test.py --api http://127.0.0.1:8000 --flows 50 --menu menu.pdf
+#   python bench/load_test.py --spawn --stream  # /qa/stream; qa_first is the time to the verdict event
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from io import BytesIO
+from typing import Dict, List, Optional
+
+import httpx
+from PIL import Image, ImageDraw
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.dirname(HERE)
+
+# Mix of questions the local engine answers and ones that need the model
+QUESTIONS = [
+    "Is the Dish 1 safe for me?",
+    "Which dishes can I eat?",
+    "Was Dish 2 cooked in a shared fryer?",
+    "Can the kitchen make Dish 3 without the sauce?",
+]
+PROFILES = [
+    {"allergens": ["peanut"]},
+    {"allergens": ["shellfish", "dairy"]},
+    {"allergens": [], "diets": ["vegan"]},
+]
+
+def synthetic_menu(seed: int) -> bytes:
+    # Unique per flow, so neither the parse cache nor upload dedup short-circuits the run
+    rng = random.Random(seed)
+    img = Image.new("RGB", (900, 1200), "white")
+    draw = ImageDraw.Draw(img)
+    draw.text((40, 20), f"MENU #{seed}", fill="black")
+    for i in range(18):
+        draw.text((40, 60 + i * 60), f"Dish {i + 1} .......... {rng.randint(6, 30)}.{rng.randint(0, 99):02d}", fill="black")
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, op: str, request) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            resp = await request
+        except httpx.HTTPError as e:
+            self.errors[op][type(e).__name__] += 1
+            return None
+        self.latencies[op].append(time.perf_counter() - start)
+        if resp.status_code >= 400:
+            self.errors[op][str(resp.status_code)] += 1
+            return None
+        return resp
+
+    async def stream(self, op: str, client: httpx.AsyncClient, path: str, body: Dict) -> bool:
+        # Records the time to the first SSE event as "<op>_first" and the full stream as <op>
+        start = time.perf_counter()
+        first = None
+        ok = False
+        try:
+            async with client.stream("POST", path, json=body) as resp:
+                if resp.status_code >= 400:
+                    self.errors[op][str(resp.status_code)] += 1
+                    return False
+                async for line in resp.aiter_lines():
+                    if first is None and line.startswith("event:"):
+                        first = time.perf_counter() - start
+                    if line == "event: answer":
+                        ok = True
+                    elif line == "event: error":
+                        self.errors[op]["error_event"] += 1
+        except httpx.HTTPError as e:
+            self.errors[op][type(e).__name__] += 1
+            return False
+        self.latencies[op].append(time.perf_counter() - start)
+        if first is not None:
+            self.latencies[f"{op}_first"].append(first)
+        return ok
+
+    def report(self, wall: float) -> Dict:
+        ops = {}
+        total = 0
+        for op in sorted(set(self.latencies) | set(self.errors)):
+            lat = self.latencies[op]  # every completed request, including 4xx/5xx
+            total += len(lat)
+            ops[op] = {
+                "requests": len(lat),
+                "errors": dict(self.errors[op]),
+                "p50_ms": _ms(percentile(lat, 0.50)),
+                "p95_ms": _ms(percentile(lat, 0.95)),
+                "p99_ms": _ms(percentile(lat, 0.99)),
+                "rps": round(len(lat) / wall, 2) if wall else None,
+            }
+        return {"wall_seconds": round(wall, 3), "requests": total, "rps": round(total / wall, 2) if wall else None, "ops": ops}
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+async def run_flow(client: httpx.AsyncClient, rec: Recorder, seed: int, args, menu: Optional[bytes]) -> bool:
+    data = menu if menu is not None else synthetic_menu(seed)
+    name = os.path.basename(args.menu) if args.menu else f"menu-{seed}.png"
+    resp = await rec.call("upload", client.post("/menus/upload", files={"file": (name, data)}))
+    if resp is None:
+        return False
+    menu_id = resp.json()["menu_id"]
+    if await rec.call("parse", client.post(f"/menus/{menu_id}/parse")) is None:
+        return False
+    rng = random.Random(seed)
+    ok = True
+    for _ in range(args.questions):
+        body = {"menu_id": menu_id, "question": rng.choice(QUESTIONS), "profile": rng.choice(PROFILES)}
+        if args.stream:
+            ok = await rec.stream("qa", client, "/qa/stream", body) and ok
+        else:
+            ok = await rec.call("qa", client.post("/qa", json=body)) is not None and ok
+    return ok
+
+async def run(args) -> Dict:
+    menu = None
+    if args.menu:
+        with open(args.menu, "rb") as f:
+            menu = f.read()
+    rec = Recorder()
+    sem = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.api, timeout=args.timeout, limits=limits) as client:
+        async def one(i: int) -> bool:
+            async with sem:
+                return await run_flow(client, rec, args.seed + i, args, menu)
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(args.flows)))
+        wall = time.perf_counter() - start
+        report = rec.report(wall)
+        report["flows"] = {"total": args.flows, "ok": sum(results), "concurrency": args.concurrency}
+        try:
+            report["server_metrics"] = (await client.get("/metrics")).json()
+        except (httpx.HTTPError, ValueError):
+            pass
+    return report
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url}: process exited with {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+def spawn(args, workdir: str) -> List[subprocess.Popen]:
+    stub_port, api_port = free_port(), free_port()
+    stub = subprocess.Popen([
+        sys.executable, os.path.join(HERE, "openai_stub.py"), "--port", str(stub_port),
+        "--latency-ms", str(args.stub_latency_ms), "--sigma", str(args.stub_sigma),
+        "--error-rate", str(args.stub_error_rate), "--items", str(args.stub_items),
+    ])
+    env = dict(
+        os.environ,
+        AI_MODE="real",
+        OPENAI_API_KEY="stub",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{stub_port}/v1",
+        MENU_STORE_PATH=os.path.join(workdir, "menus.db"),
+        PARSE_CACHE_DIR=os.path.join(workdir, "parse_cache"),
+        LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"),
+        WEB_CONCURRENCY=str(args.workers),  # uvicorn's worker count; main.py splits the quotas by it
+    )
+    api = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port), "--log-level", "warning",
+    ], cwd=API_DIR, env=env)
+    procs = [stub, api]
+    try:
+        wait_ready(f"http://127.0.0.1:{stub_port}/stats", stub)
+        wait_ready(f"http://127.0.0.1:{api_port}/readyz", api)
+    except Exception:
+        stop(procs)
+        raise
+    args.api = f"http://127.0.0.1:{api_port}"
+    return procs
+
+def stop(procs: List[subprocess.Popen]) -> None:
+    for p in procs:
+        p.terminate()
+    for p in procs:
+        try:
+            p.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+def print_report(report: Dict) -> None:
+    flows = report["flows"]
+    print(f"flows: {flows['ok']}/{flows['total']} ok at concurrency {flows['concurrency']}, "
+          f"{report['requests']} requests in {report['wall_seconds']}s ({report['rps']} req/s)")
+    print(f"{'op':<8} {'n':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  errors")
+    for op, r in report["ops"].items():
+        print(f"{op:<8} {r['requests']:>6} {r['rps']:>8} {r['p50_ms']!s:>9} {r['p95_ms']!s:>9} {r['p99_ms']!s:>9}  {r['errors'] or ''}")
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--api", default="http://127.0.0.1:8000", help="running API (ignored with --spawn)")
+    ap.add_argument("--spawn", action="store_true", help="start the OpenAI stub and the API locally")
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn workers with --spawn")
+    ap.add_argument("--flows", type=int, default=50, help="upload → parse → qa sequences")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--questions", type=int, default=3, help="/qa calls per flow")
+    ap.add_argument("--stream", action="store_true", help="ask through /qa/stream instead of /qa")
+    ap.add_argument("--menu", help="upload this file in every flow instead of a unique synthetic menu")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--stub-latency-ms", type=float, default=300.0)
+    ap.add_argument("--stub-sigma", type=float, default=0.4)
+    ap.add_argument("--stub-error-rate", type=float, default=0.0)
+    ap.add_argument("--stub-items", type=int, default=12)
+    ap.add_argument("--json", action="store_true", help="print the full report as JSON")
+    ap.add_argument("--max-error-rate", type=float, help="exit 1 if more flows than this fraction fail")
+    args = ap.parse_args()
+
+    procs: List[subprocess.Popen] = []
+    with tempfile.TemporaryDirectory(prefix="allerlens-bench-") as workdir:
+        try:
+            if args.spawn:
+                procs = spawn(args, workdir)
+            report = asyncio.run(run(args))
+        finally:
+            stop(procs)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    failed = 1 - report["flows"]["ok"] / max(1, report["flows"]["total"])
+    if args.max_error_rate is not None and failed > args.max_error_rate:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,180 @@
+# OpenAI-compatible stub for offline load tests: serves /v1/chat/completions with schema-valid
+# menu parses and Q&A answers, after a log-normal latency, with a configurable error rate.
+# stream=true is supported: the first chunk arrives after the latency, the rest over --stream-ms.
+#
+#   python bench/openai_stub.py --port 8900 --latency-ms 800 --sigma 0.4 --error-rate 0.02
+#   OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=stub uvicorn main:app
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+INGREDIENTS = [
+    "chicken", "romaine", "parmesan", "croutons", "peanuts", "shrimp", "egg", "rice noodles",
+    "tofu", "sesame oil", "soy sauce", "wheat flour", "butter", "walnuts", "salmon", "tomato",
+]
+SECTIONS = ["Starters", "Salads", "Mains", "Desserts"]
+ICONS = ["vegan", "gluten", "peanut", "spicy", "dairy"]
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 600.0  # median
+    sigma: float = 0.4  # log-normal spread; 0 makes every call take exactly latency_ms
+    qa_latency_ms: float = 0.0  # Q&A median when set; otherwise latency_ms
+    error_rate: float = 0.0
+    error_status: int = 429
+    items: int = 12  # menu items per parsed page
+    stream_ms: float = 300.0  # time to deliver a streamed completion after its first chunk
+    seed: int = 0
+
+def sample_latency(cfg: StubConfig, median_ms: float) -> float:
+    if cfg.sigma <= 0:
+        return median_ms / 1000
+    return random.lognormvariate(math.log(median_ms / 1000), cfg.sigma)
+
+def menu_page(n_items: int) -> Dict[str, Any]:
+    items = []
+    for i in range(n_items):
+        top = 40 + i * 60
+        items.append({
+            "name": f"Dish {i + 1}",
+            "ingredients": random.sample(INGREDIENTS, 3),
+            "price": round(random.uniform(6, 30), 2),
+            "section": SECTIONS[i % len(SECTIONS)],
+            "bbox": [40, top, 600, top + 40],
+        })
+    icons = [
+        {"label": random.choice(ICONS), "bbox": [610, it["bbox"][1], 640, it["bbox"][3]], "confidence": 0.9}
+        for it in items[::3]
+    ]
+    return {"page": 1, "items": items, "icons": icons, "tables": []}
+
+def qa_answer() -> Dict[str, Any]:
+    return {
+        "result": random.choice(["safe", "unsafe", "ask_server"]),
+        "reasons": ["Stubbed analysis of the provided context"],
+        "alternatives": ["Dish 1"],
+        "citations": [{"page": 1, "bbox": [40, 40, 600, 80], "type": "item", "text": "Dish 1"}],
+        "summary": "Stub answer; confirm with your server.",
+    }
+
+def completion(content: Dict[str, Any], prompt_chars: int) -> Dict[str, Any]:
+    text = json.dumps(content)
+    prompt_tokens = prompt_chars // 4 + 1
+    completion_tokens = len(text) // 4 + 1
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "stub",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+async def stream_completion(content: Dict[str, Any], prompt_chars: int, duration: float, piece: int = 24):
+    # chat.completion.chunk SSE frames, then a usage-only chunk and [DONE]
+    full = completion(content, prompt_chars)
+    text = full["choices"][0]["message"]["content"]
+    pieces = [text[i:i + piece] for i in range(0, len(text), piece)]
+    base = {"id": full["id"], "object": "chat.completion.chunk", "created": full["created"], "model": "stub"}
+    for n, part in enumerate(pieces):
+        delta = {"role": "assistant", "content": part} if n == 0 else {"content": part}
+        chunk = {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(duration / len(pieces))
+    yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+    yield f"data: {json.dumps({**base, 'choices': [], 'usage': full['usage']})}\n\n"
+    yield "data: [DONE]\n\n"
+
+def prompt_text(messages: List[Dict[str, Any]]) -> str:
+    parts = []
+    for m in messages:
+        content = m.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts += [c.get("text", "") for c in content if c.get("type") == "text"]
+    return "\n".join(parts)
+
+def create_app(cfg: StubConfig) -> FastAPI:
+    app = FastAPI(title="OpenAI stub")
+    app.state.requests = 0
+    app.state.errors = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        schema = body.get("response_format", {}).get("json_schema", {}).get("name")
+        text = prompt_text(body.get("messages", []))
+        median = cfg.qa_latency_ms if schema != "MenuPage" and cfg.qa_latency_ms else cfg.latency_ms
+        await asyncio.sleep(sample_latency(cfg, median))
+        app.state.requests += 1
+
+        if random.random() < cfg.error_rate:
+            app.state.errors += 1
+            return JSONResponse(status_code=cfg.error_status, content={"error": {
+                "message": "stubbed upstream error", "type": "stub_error", "code": str(cfg.error_status),
+            }})
+
+        if schema == "MenuPage":
+            content = menu_page(cfg.items)
+        elif schema == "QABatchResponse":
+            ids = sorted({int(i) for i in re.findall(r"^\[(\d+)\] user_profile", text, re.M)})
+            content = {"answers": [{"id": i, **qa_answer()} for i in ids]}
+        else:
+            content = qa_answer()
+        if body.get("stream"):
+            return StreamingResponse(
+                stream_completion(content, len(text), cfg.stream_ms / 1000), media_type="text/event-stream"
+            )
+        return completion(content, len(text))
+
+    @app.get("/stats")
+    def stats():
+        return {"requests": app.state.requests, "errors": app.state.errors}
+
+    return app
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8900)
+    ap.add_argument("--latency-ms", type=float, default=StubConfig.latency_ms, help="median latency")
+    ap.add_argument("--qa-latency-ms", type=float, default=StubConfig.qa_latency_ms, help="median Q&A latency")
+    ap.add_argument("--sigma", type=float, default=StubConfig.sigma, help="log-normal latency spread")
+    ap.add_argument("--error-rate", type=float, default=StubConfig.error_rate)
+    ap.add_argument("--error-status", type=int, default=StubConfig.error_status)
+    ap.add_argument("--items", type=int, default=StubConfig.items, help="menu items per page")
+    ap.add_argument("--stream-ms", type=float, default=StubConfig.stream_ms, help="streamed completion duration")
+    ap.add_argument("--seed", type=int, default=StubConfig.seed)
+    args = ap.parse_args()
+
+    cfg = StubConfig(
+        latency_ms=args.latency_ms, sigma=args.sigma, qa_latency_ms=args.qa_latency_ms,
+        error_rate=args.error_rate, error_status=args.error_status, items=args.items,
+        stream_ms=args.stream_ms, seed=args.seed,
+    )
+    random.seed(cfg.seed)
+    uvicorn.run(create_app(cfg), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,101 @@
+# Per-menu retrieval index for /qa prompts.
+#
+# Built once at parse time from items (and table rows). For each question, entries are scored
+# lexically (idf-weighted word overlap) plus by allergen/diet tags shared with the profile, then
+# packed as compact JSON under a token budget, so the prompt is always well-formed and the most
+# relevant items survive on long menus.
+import json
+import math
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Set
+
+from allergens import item_tags, tokens
+
+CONTEXT_LEGEND = (
+    "Menu entries as JSON. Keys: p=page, n=item name, s=section, $=price, i=ingredients, "
+    "l=allergen/diet labels detected, b=bbox [x1,y1,x2,y2] in page pixels, row=table row text. "
+    "'omitted' counts lower-ranked entries left out for length."
+)
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+def _compact(obj: Dict[str, Any]) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+class MenuIndex:
+    def __init__(self):
+        self.entries: List[str] = []         # compact JSON per entry, in menu order
+        self.labels: List[Set[str]] = []
+        self.postings: Dict[str, Set[int]] = defaultdict(set)
+
+    @classmethod
+    def build(cls, parsed_pages: List[Dict[str, Any]]) -> "MenuIndex":
+        idx = cls()
+        for page_no, page in enumerate(parsed_pages, start=1):
+            page_no = page.get("page") or page_no
+            icons = page.get("icons") or []
+            for item in page.get("items") or []:
+                tags = item_tags(item, icons)
+                labels = set(tags["allergens"]) | set(tags["diets"]) | set(tags["icons"])
+                entry = {"p": page_no, "n": item.get("name")}
+                if item.get("section"):
+                    entry["s"] = item["section"]
+                if item.get("price") is not None:
+                    entry["$"] = item["price"]
+                if item.get("ingredients"):
+                    entry["i"] = item["ingredients"]
+                if labels:
+                    entry["l"] = sorted(labels)
+                entry["b"] = item.get("bbox")
+                text = " ".join([item.get("name") or "", item.get("section") or ""] + list(item.get("ingredients") or []))
+                idx._add(_compact(entry), text, labels)
+            for table in page.get("tables") or []:
+                rows: Dict[int, List[tuple]] = defaultdict(list)
+                for cell in table.get("cells") or []:
+                    rows[cell.get("r", 0)].append((cell.get("c", 0), cell.get("text", "")))
+                for r in sorted(rows):
+                    row_text = " | ".join(t for _, t in sorted(rows[r]))
+                    idx._add(_compact({"p": page_no, "row": row_text, "b": table.get("bbox")}), row_text, set())
+        return idx
+
+    def _add(self, entry: str, text: str, labels: Set[str]) -> None:
+        i = len(self.entries)
+        self.entries.append(entry)
+        self.labels.append(labels)
+        for word in set(tokens(text)):
+            self.postings[word].add(i)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def scores(self, question: str, labels: Iterable[str]) -> List[float]:
+        n = len(self.entries)
+        out = [0.0] * n
+        for word in set(tokens(question)):
+            hits = self.postings.get(word)
+            if hits:
+                idf = math.log(1 + n / len(hits))
+                for i in hits:
+                    out[i] += idf
+        wanted = set(labels)
+        if wanted:
+            for i, entry_labels in enumerate(self.labels):
+                out[i] += 0.5 * len(wanted & entry_labels)
+        return out
+
+    def pack(self, question: str, labels: Iterable[str], budget_tokens: int) -> str:
+        # Highest score first, ties in menu order; then re-emit selected entries in menu order
+        scores = self.scores(question, labels)
+        ranked = sorted(range(len(self.entries)), key=lambda i: (-scores[i], i))
+        chosen: List[int] = []
+        used = estimate_tokens('{"entries":[],"omitted":000}')
+        for i in ranked:
+            cost = estimate_tokens(self.entries[i]) + 1
+            if used + cost > budget_tokens:
+                continue
+            chosen.append(i)
+            used += cost
+        chosen.sort()
+        omitted = len(self.entries) - len(chosen)
+        return '{"entries":[' + ",".join(self.entries[i] for i in chosen) + '],"omitted":' + str(omitted) + "}"
@@ -0,0 +1,195 @@
+# Image normalization for vision requests: EXIF rotation, downscale, optional margin crop and
+# adaptive re-encode. Bboxes returned by the model are in normalized-image pixels;
+# rescale_page_bboxes maps them back onto the original image.
+#
+# Pages larger than max_edge can also be split into overlapping full-resolution tiles, so fine
+# print survives; each tile is a NormalizedImage whose offset places it on the original page.
+import math
+from dataclasses import dataclass, field, replace
+from io import BytesIO
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image, ImageChops, ImageOps, ImageStat
+
+JPEG_QUALITY_LADDER = (85, 75, 65, 55)
+GRAYSCALE_TOLERANCE = 3.0   # mean |R-G|,|G-B| below this counts as a grayscale scan
+CROP_THRESHOLD = 24         # per-pixel difference from the background colour that counts as ink
+CROP_PADDING = 8            # px kept around the detected content
+DHASH_SIZE = 32             # 32×32 = 1024-bit perceptual hash; cells of ~64 px on a 2048 px page
+
+@dataclass
+class NormalizedImage:
+    data: bytes
+    mime: str
+    scale: float                    # normalized px per original px
+    offset: Tuple[int, int]         # top-left of the crop, in original px
+    original_size: Tuple[int, int]  # (w, h) after EXIF rotation
+    size: Tuple[int, int]           # (w, h) of the encoded image
+    original_bytes: int = 0
+    dhash: int = 0                  # perceptual hash of the normalized pixels (see dhash())
+    tiles: List["NormalizedImage"] = field(default_factory=list)  # row-major; empty unless tiled
+
+def _flatten(img: Image.Image) -> Image.Image:
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        bg = Image.new("RGB", rgba.size, (255, 255, 255))
+        bg.paste(rgba, mask=rgba.getchannel("A"))
+        return bg
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+def _is_grayscale(img: Image.Image) -> bool:
+    thumb = img.copy()
+    thumb.thumbnail((128, 128))
+    r, g, b = thumb.split()
+    diff_rg = ImageStat.Stat(ImageChops.difference(r, g)).mean[0]
+    diff_gb = ImageStat.Stat(ImageChops.difference(g, b)).mean[0]
+    return max(diff_rg, diff_gb) < GRAYSCALE_TOLERANCE
+
+def content_bbox(img: Image.Image) -> Tuple[int, int, int, int]:
+    # Background colour is taken from the top-left corner (paper / wall colour)
+    bg = Image.new(img.mode, img.size, img.getpixel((0, 0)))
+    diff = ImageChops.difference(img, bg).convert("L").point(lambda p: 255 if p > CROP_THRESHOLD else 0)
+    box = diff.getbbox()
+    if not box:
+        return (0, 0, img.width, img.height)
+    x1, y1, x2, y2 = box
+    return (
+        max(0, x1 - CROP_PADDING),
+        max(0, y1 - CROP_PADDING),
+        min(img.width, x2 + CROP_PADDING),
+        min(img.height, y2 + CROP_PADDING),
+    )
+
+def _encode_jpeg(img: Image.Image, target_bytes: int) -> bytes:
+    data = b""
+    for quality in JPEG_QUALITY_LADDER:
+        buf = BytesIO()
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+        data = buf.getvalue()
+        if len(data) <= target_bytes:
+            break
+    return data
+
+def normalize_image(
+    img: Image.Image,
+    max_edge: int = 2048,
+    target_bytes: int = 1_000_000,
+    crop_margins: bool = False,
+    original_bytes: int = 0,
+    tile_edge: int = 0,
+    tile_overlap: int = 0,
+) -> NormalizedImage:
+    img = ImageOps.exif_transpose(img)
+    img = _flatten(img)
+    original_size = img.size
+
+    offset = (0, 0)
+    if crop_margins:
+        box = content_bbox(img)
+        if box != (0, 0, img.width, img.height):
+            img = img.crop(box)
+            offset = (box[0], box[1])
+
+    tiles: List[NormalizedImage] = []
+    if tile_edge and max_edge and max(img.size) > max_edge:
+        tiles = _tile_images(img, tile_edge, tile_overlap, offset, original_size, max_edge, target_bytes)
+
+    scale = 1.0
+    longest = max(img.size)
+    if max_edge and longest > max_edge:
+        scale = max_edge / longest
+        img = img.resize(
+            (max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+            Image.Resampling.LANCZOS,
+        )
+
+    if _is_grayscale(img):
+        img = img.convert("L")
+
+    data = _encode_jpeg(img, target_bytes)
+    return NormalizedImage(
+        data=data,
+        mime="image/jpeg",
+        scale=scale,
+        offset=offset,
+        original_size=original_size,
+        size=img.size,
+        original_bytes=original_bytes,
+        dhash=dhash(img),
+        tiles=tiles,
+    )
+
+def tile_boxes(width: int, height: int, edge: int, overlap: int) -> List[Tuple[int, int, int, int]]:
+    # Row-major grid of boxes at most edge px square, evenly spread so neighbours share at least
+    # `overlap` px; anything printed across a seam appears whole in at least one tile.
+    overlap = min(overlap, edge // 2)
+
+    def starts(length: int) -> List[int]:
+        if length <= edge:
+            return [0]
+        n = math.ceil((length - overlap) / (edge - overlap))
+        step = (length - edge) / (n - 1)
+        return [round(i * step) for i in range(n)]
+
+    return [
+        (x, y, min(width, x + edge), min(height, y + edge))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+def _tile_images(
+    img: Image.Image,
+    edge: int,
+    overlap: int,
+    offset: Tuple[int, int],
+    original_size: Tuple[int, int],
+    max_edge: int,
+    target_bytes: int,
+) -> List[NormalizedImage]:
+    tiles = []
+    for box in tile_boxes(img.width, img.height, edge, overlap):
+        tile = normalize_image(img.crop(box), max_edge=max_edge, target_bytes=target_bytes)
+        tiles.append(replace(
+            tile,
+            offset=(offset[0] + box[0], offset[1] + box[1]),
+            original_size=original_size,
+        ))
+    return tiles
+
+def dhash(img: Image.Image, hash_size: int = DHASH_SIZE) -> int:
+    # Difference hash: one bit per horizontally adjacent pair of a (size+1)×size box-filtered
+    # grayscale thumbnail. Stable across re-encoding and re-rasterization of the same page.
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+    px = small.tobytes()
+    bits = 0
+    for y in range(hash_size):
+        row = px[y * (hash_size + 1):(y + 1) * (hash_size + 1)]
+        for x in range(hash_size):
+            bits = (bits << 1) | (row[x] > row[x + 1])
+    return bits
+
+def normalize_bytes(data: bytes, **kwargs) -> NormalizedImage:
+    with Image.open(BytesIO(data)) as img:
+        img.load()
+        return normalize_image(img, original_bytes=len(data), **kwargs)
+
+def _rescale_bbox(bbox: List[float], norm: NormalizedImage) -> List[float]:
+    if not bbox or len(bbox) != 4:
+        return bbox
+    ox, oy = norm.offset
+    x1, y1, x2, y2 = bbox
+    return [
+        round(x1 / norm.scale + ox, 1),
+        round(y1 / norm.scale + oy, 1),
+        round(x2 / norm.scale + ox, 1),
+        round(y2 / norm.scale + oy, 1),
+    ]
+
+def rescale_page_bboxes(page: Dict[str, Any], norm: NormalizedImage) -> Dict[str, Any]:
+    if norm.scale == 1.0 and norm.offset == (0, 0):
+        return page
+    for key in ("items", "icons", "tables"):
+        for entry in page.get(key) or []:
+            if "bbox" in entry:
+                entry["bbox"] = _rescale_bbox(entry["bbox"], norm)
+    return page
@@ -0,0 +1,184 @@
+# Background parse jobs: a bounded pool of asyncio workers with round-robin scheduling across
+# menus, page-by-page progress, partial results and an event feed for Server-Sent Events.
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+
+ACTIVE = ("queued", "running")
+
+class QueueFull(Exception):
+    pass
+
+class ParseJob:
+    def __init__(self, menu_id: str):
+        self.id = str(uuid.uuid4())
+        self.menu_id = menu_id
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.pages_total: Optional[int] = None
+        self.pages: Dict[int, Dict[str, Any]] = {}
+        self.failed_pages: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+        self._subscribers: List[asyncio.Queue] = []
+
+    # -- progress, called from the runner --
+    def start(self, pages_total: Optional[int]) -> None:
+        self.status = "running"
+        self.started_at = time.time()
+        self.pages_total = pages_total
+        self._publish("status", self.snapshot(include_pages=False))
+
+    def page_done(self, page_no: int, page: Optional[Dict[str, Any]], error: Optional[str] = None) -> None:
+        if page is not None:
+            self.pages[page_no] = page
+        else:
+            self.failed_pages.append({"page": page_no, "error": error})
+        self._publish("page", {
+            "page": page_no,
+            "ok": page is not None,
+            "error": error,
+            "result": page,
+            "pages_done": self.pages_done,
+            "pages_total": self.pages_total,
+        })
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        self._publish("done", self.snapshot(include_pages=False))
+
+    @property
+    def pages_done(self) -> int:
+        return len(self.pages) + len(self.failed_pages)
+
+    def snapshot(self, include_pages: bool = True) -> Dict[str, Any]:
+        out = {
+            "job_id": self.id,
+            "menu_id": self.menu_id,
+            "status": self.status,
+            "pages_total": self.pages_total,
+            "pages_done": self.pages_done,
+            "failed_pages": sorted(self.failed_pages, key=lambda f: f["page"]),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if include_pages:
+            out["pages"] = [self.pages[p] for p in sorted(self.pages)]
+        return out
+
+    # -- event feed --
+    def _publish(self, event: str, data: Dict[str, Any]) -> None:
+        for q in self._subscribers:
+            q.put_nowait((event, data))
+
+    async def events(self) -> AsyncIterator[str]:
+        # SSE frames: a catch-up snapshot, then live page/status events until the job is done
+        q: asyncio.Queue = asyncio.Queue()
+        self._subscribers.append(q)
+        try:
+            yield sse_event("snapshot", self.snapshot())
+            if self.status not in ACTIVE:
+                yield sse_event("done", self.snapshot(include_pages=False))
+                return
+            while True:
+                event, data = await q.get()
+                yield sse_event(event, data)
+                if event == "done":
+                    return
+        finally:
+            self._subscribers.remove(q)
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+class JobQueue:
+    def __init__(self, runner: Callable[[ParseJob], Awaitable[None]], workers: int = 2,
+                 max_pending: int = 100, keep_finished: int = 500):
+        self.runner = runner
+        self.workers = workers
+        self.max_pending = max_pending
+        self.keep_finished = keep_finished
+        self.jobs: "OrderedDict[str, ParseJob]" = OrderedDict()
+        self._pending: "OrderedDict[str, Deque[ParseJob]]" = OrderedDict()  # menu_id → its queued jobs
+        self._pending_count = 0
+        self._active_by_menu: Dict[str, ParseJob] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def submit(self, menu_id: str) -> ParseJob:
+        # A menu already queued or being parsed gets its existing job back
+        existing = self._active_by_menu.get(menu_id)
+        if existing is not None and existing.status in ACTIVE:
+            return existing
+        if self._pending_count >= self.max_pending:
+            raise QueueFull(f"{self._pending_count} parse jobs already queued")
+        self._ensure_workers()
+        job = ParseJob(menu_id)
+        self.jobs[job.id] = job
+        self._active_by_menu[menu_id] = job
+        self._pending.setdefault(menu_id, deque()).append(job)
+        self._pending_count += 1
+        self._wakeup.set()
+        self._trim()
+        return job
+
+    def get(self, job_id: str) -> Optional[ParseJob]:
+        return self.jobs.get(job_id)
+
+    def stats(self) -> Dict[str, int]:
+        running = sum(1 for j in self._active_by_menu.values() if j.status == "running")
+        return {"queued": self._pending_count, "running": running, "workers": len(self._tasks)}
+
+    def _ensure_workers(self) -> None:
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"parse-worker-{i}") for i in range(self.workers)]
+
+    def _next(self) -> Optional[ParseJob]:
+        # Round-robin: take the head job of the first menu, then move that menu to the back
+        if not self._pending:
+            return None
+        menu_id, queue = next(iter(self._pending.items()))
+        job = queue.popleft()
+        del self._pending[menu_id]
+        if queue:
+            self._pending[menu_id] = queue
+        self._pending_count -= 1
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            job = self._next()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            try:
+                await self.runner(job)
+            except Exception as e:
+                job.finish("failed", error=str(e))
+            finally:
+                if job.status in ACTIVE:
+                    job.finish("failed", error="worker exited without finishing the job")
+                if self._active_by_menu.get(job.menu_id) is job:
+                    del self._active_by_menu[job.menu_id]
+
+    def _trim(self) -> None:
+        finished = [jid for jid, j in self.jobs.items() if j.status not in ACTIVE]
+        for jid in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[jid]
+
+    async def shutdown(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,88 @@
+# Incremental parsing of one JSON object arriving in chunks (a streamed structured completion).
+# Reports each top-level field as soon as its value is complete, and each element of a top-level
+# array as soon as that element is complete, without re-scanning what was already consumed.
+import json
+from typing import Any, List, Optional, Tuple
+
+# ("field", key, value) once a top-level value is complete (arrays included, after their items)
+# ("item", key, value) for every element of a top-level array
+Event = Tuple[str, str, Any]
+
+class JSONObjectStream:
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key: Optional[str] = None  # top-level key whose value is being read
+        self._key_start: Optional[int] = None
+        self._value_start: Optional[int] = None
+        self._item_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Event]:
+        self.text += chunk
+        events: List[Event] = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key_start is not None:
+                        self._key = json.loads(text[self._key_start:i + 1])
+                        self._key_start = None
+                    elif self._depth == 1 and self._value_start is not None:
+                        self._field_done(events, i + 1)
+                continue
+            if ch.isspace():
+                continue
+            if self._depth == 2 and self._item_start is None and ch not in ",]":
+                self._item_start = i
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None:
+                    self._key_start = i
+                elif self._depth == 1 and self._value_start is None:
+                    self._value_start = i
+            elif ch in "{[":
+                if self._depth == 1 and self._value_start is None:
+                    self._value_start = i
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 2 and ch == "]":
+                    self._item_done(events, i)
+                elif self._depth == 1 and self._value_start is not None:
+                    self._field_done(events, i)  # trailing number, true, false or null
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    self._field_done(events, i + 1)
+            elif ch == ",":
+                if self._depth == 2:
+                    self._item_done(events, i)
+                elif self._depth == 1 and self._value_start is not None:
+                    self._field_done(events, i)  # number, true, false or null
+            elif ch == ":":
+                continue
+            elif self._depth == 1 and self._key is not None and self._value_start is None:
+                self._value_start = i
+        self._pos = len(text)
+        return events
+
+    def _item_done(self, events: List[Event], end: int) -> None:
+        if self._item_start is not None:
+            events.append(("item", self._key, json.loads(self.text[self._item_start:end])))
+            self._item_start = None
+
+    def _field_done(self, events: List[Event], end: int) -> None:
+        events.append(("field", self._key, json.loads(self.text[self._value_start:end])))
+        self._key = None
+        self._value_start = None
+
+    def result(self) -> Any:
+        # The whole object; raises ValueError if the stream ended early or is not valid JSON
+        return json.loads(self.text)
@@ -0,0 +1,276 @@
+# Resilient wrapper around the OpenAI clients, shared by every parse and Q&A call:
+# token-bucket limits for requests/min and tokens/min, exponential backoff with jitter on
+# retryable errors, and a circuit breaker that fails fast while the upstream is down.
+# The clients themselves can be opened lazily through `connect`, keeping the openai import
+# (and its HTTP pools) out of process start-up.
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Optional, Tuple
+
+log = logging.getLogger("allerlens.openai")
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+class UpstreamError(Exception):
+    # Surfaced to clients as-is: 503 while the model is unavailable, 502 for a bad upstream reply
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[float] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class TokenBucket:
+    # Capacity refills continuously at `per_minute`. reserve() debits right away and returns how
+    # long the caller must wait, so concurrent callers queue up in arrival order.
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+            self._updated = now
+            self._level -= min(amount, self.capacity)
+            return 0.0 if self._level >= 0 else -self._level / self.rate
+
+    def refund(self, amount: float) -> None:
+        # Negative amounts debit: used to settle an estimate against the actual usage
+        with self._lock:
+            self._level = min(self.capacity, self._level + amount)
+
+class CircuitBreaker:
+    # closed → open after `threshold` consecutive failures; after `reset_seconds` one trial call
+    # is let through (half-open) and its outcome closes or re-opens the circuit
+    def __init__(self, threshold: int = 5, reset_seconds: float = 30.0):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> None:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return
+        raise UpstreamError(503, "Model service temporarily unavailable", retry_after=self.retry_after() or 1.0)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def release_trial(self) -> None:
+        # The trial call ended without a verdict (cancelled, or rate-limited); let another one through
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+def is_retryable(e: Exception) -> bool:
+    import openai  # already loaded by whichever client raised e
+
+    if isinstance(e, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return isinstance(e, openai.APIStatusError) and e.status_code in RETRYABLE_STATUS
+
+def is_rate_limited(e: Exception) -> bool:
+    return getattr(e, "status_code", None) == 429
+
+def _retry_after_header(e: Exception) -> Optional[float]:
+    response = getattr(e, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+class ResilientClient:
+    def __init__(self, client=None, aclient=None, requests_per_minute: int = 500, tokens_per_minute: int = 200_000,
+                 max_retries: int = 4, base_delay: float = 0.5, max_delay: float = 20.0,
+                 breaker: Optional[CircuitBreaker] = None,
+                 connect: Optional[Callable[[], Tuple[Any, Any]]] = None):
+        # connect() returns (client, aclient) and runs once, on first use; it may raise
+        # UpstreamError, e.g. when no API key is configured, which fails only that request
+        self._client = client
+        self._aclient = aclient
+        self._connect = connect
+        self._connect_lock = threading.Lock()
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.retries_total = 0
+
+    def _open(self) -> None:
+        with self._connect_lock:
+            if self._connect is None:
+                return
+            client, aclient = self._connect()
+            self._client = self._client or client
+            self._aclient = self._aclient or aclient
+            self._connect = None
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            self._open()
+        return self._client
+
+    @client.setter
+    def client(self, value: Any) -> None:
+        self._client = value
+
+    @property
+    def aclient(self) -> Any:
+        if self._aclient is None:
+            self._open()
+        return self._aclient
+
+    @aclient.setter
+    def aclient(self, value: Any) -> None:
+        self._aclient = value
+
+    def unavailable(self) -> bool:
+        return self.breaker.state == "open"
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+
+    def _settle(self, estimated_tokens: int, resp: Any) -> None:
+        usage = getattr(resp, "usage", None)
+        used = getattr(usage, "total_tokens", None)
+        if isinstance(used, int):
+            self.tokens.refund(estimated_tokens - used)
+
+    def _backoff(self, attempt: int, e: Exception) -> float:
+        # Full jitter, but never sooner than the server's Retry-After
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, _retry_after_header(e) or 0.0)
+
+    def _failed(self, e: Exception, attempt: int) -> float:
+        # Returns the delay before the next attempt, or raises the error to surface
+        if not is_retryable(e):
+            self.breaker.record_success()  # the upstream answered; the request itself was bad
+            raise UpstreamError(502, f"Model request failed: {e}") from e
+        # A 429 is quota pressure, not an outage: backoff handles it, and counting it toward the
+        # breaker would let one rate-limited request open the circuit for every caller
+        rate_limited = is_rate_limited(e)
+        if rate_limited:
+            self.breaker.release_trial()
+        else:
+            self.breaker.record_failure()
+        if attempt >= self.max_retries or self.unavailable():
+            log.error("model call failed", extra={"attempts": attempt + 1, "circuit": self.breaker.state, "error": str(e)})
+            if rate_limited:
+                raise UpstreamError(429, f"Model rate limit reached: {e}",
+                                    retry_after=_retry_after_header(e) or self.max_delay) from e
+            raise UpstreamError(503, f"Model service unavailable: {e}",
+                                retry_after=self.breaker.retry_after() or None) from e
+        self.retries_total += 1
+        delay = self._backoff(attempt, e)
+        log.warning("retrying model call", extra={"attempt": attempt + 1, "delay": round(delay, 3), "error": str(e)})
+        return delay
+
+    def create(self, estimated_tokens: int = 1000, **kwargs) -> Any:
+        client = self.client
+        for attempt in range(self.max_retries + 1):
+            self.breaker.allow()
+            try:
+                time.sleep(self._reserve(estimated_tokens))
+                resp = client.chat.completions.create(**kwargs)
+            except Exception as e:
+                time.sleep(self._failed(e, attempt))
+                continue
+            except BaseException:
+                self.breaker.release_trial()
+                raise
+            self.breaker.record_success()
+            self._settle(estimated_tokens, resp)
+            return resp
+
+    async def acreate(self, estimated_tokens: int = 1000, **kwargs) -> Any:
+        aclient = self.aclient
+        for attempt in range(self.max_retries + 1):
+            self.breaker.allow()
+            try:
+                await asyncio.sleep(self._reserve(estimated_tokens))
+                resp = await aclient.chat.completions.create(**kwargs)
+            except Exception as e:
+                await asyncio.sleep(self._failed(e, attempt))
+                continue
+            except BaseException:  # cancelled: a half-open trial must not hold the slot forever
+                self.breaker.release_trial()
+                raise
+            self.breaker.record_success()
+            self._settle(estimated_tokens, resp)
+            return resp
+
+    async def astream(self, estimated_tokens: int = 1000, **kwargs) -> AsyncIterator[Any]:
+        # Streamed completion chunks. Retries only happen before the stream opens; a stream that
+        # breaks midway surfaces as a 502 since part of the answer has already been delivered.
+        aclient = self.aclient
+        for attempt in range(self.max_retries + 1):
+            self.breaker.allow()
+            try:
+                await asyncio.sleep(self._reserve(estimated_tokens))
+                stream = await aclient.chat.completions.create(
+                    stream=True, stream_options={"include_usage": True}, **kwargs
+                )
+                break
+            except Exception as e:
+                await asyncio.sleep(self._failed(e, attempt))
+            except BaseException:
+                self.breaker.release_trial()
+                raise
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    self._settle(estimated_tokens, chunk)
+                yield chunk
+        except Exception as e:
+            self.breaker.record_failure()
+            raise UpstreamError(502, f"Model stream interrupted: {e}") from e
+        except BaseException:  # the consumer went away (client disconnect, cancellation)
+            self.breaker.release_trial()
+            raise
+        finally:
+            await stream.close()
+        self.breaker.record_success()
+
+    def stats(self) -> dict:
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "retries_total": self.retries_total,
+        }
@@ -0,0 +1,231 @@
+# Deterministic /qa fast path: answers allergen questions from the parsed items, icons and the
+# diner's profile. Returns a QAResponse-shaped dict plus a confidence; the route escalates to the
+# model when confidence is below its threshold. The per-item tagging is profile-agnostic, so
+# tag_items runs once per parse version (MenuView.qa_items) and each question only compares labels.
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from allergens import (
+    ALLERGEN_LABELS, DIET_LABELS, PROFILE_ALIASES, PROFILE_GROUPS, canonical_labels, icons_for_item, is_meat,
+    is_non_vegan_extra, item_tags, tokens,
+)
+
+# Questions about things the parsed menu cannot tell us
+UNSUPPORTED_TOPICS = {
+    "sodium", "salt", "calorie", "kcal", "carb", "sugar", "fat", "protein", "organic", "halal", "kosher",
+    "fryer", "oil", "cross", "contamination", "contact", "prepared", "kitchen", "shared", "trace",
+    "portion", "price", "cost", "recommend", "best", "popular", "substitute", "without", "modify",
+}
+GENERAL_CUES = {"anything", "something", "everything", "any", "what", "which", "menu", "option", "dish", "item"}
+# Whole-menu questions come in two kinds: "is everything / does any dish contain ..." is answered
+# unsafe by a single conflicting item, "what / which can I eat" by a single safe one
+EVERY_CUES = {"everything", "every", "all", "entire", "whole", "contain"}
+CHOICE_CUES = {"what", "which", "option", "choice"}
+CHOICE_VERBS = {"eat", "order", "have", "get", "try", "choose", "pick"}
+STOPWORDS = {"the", "a", "an", "and", "or", "with", "of", "in", "on", "is", "are", "it", "for", "to", "i", "my", "can"}
+LABEL_TEXT = {
+    "peanut": "peanut", "tree_nut": "tree nut", "shellfish": "shellfish", "egg": "egg", "dairy": "dairy",
+    "gluten": "gluten", "vegan": "vegan", "vegetarian": "vegetarian",
+}
+
+def labels_mentioned(question: str) -> Set[str]:
+    seq = tokens(question)
+    found = set()
+    for i, word in enumerate(seq):
+        for phrase in (f"{word} {seq[i + 1]}" if i + 1 < len(seq) else None, word):
+            if phrase and (phrase in PROFILE_ALIASES or phrase in PROFILE_GROUPS):
+                found.update(canonical_labels(phrase))
+                break
+    return found
+
+def _item_text(item: Dict[str, Any]) -> str:
+    return " ".join([item.get("name") or ""] + list(item.get("ingredients") or []))
+
+@dataclass
+class TaggedItem:
+    page: int
+    item: Dict[str, Any]
+    tags: Dict[str, Any]          # allergens.item_tags
+    icons: List[Dict[str, Any]]   # the icons on the item's line
+    meat: bool
+    non_vegan_extra: bool
+    name_words: List[str]         # distinctive words of the name, for matching questions
+
+    @property
+    def name(self) -> str:
+        return self.item.get("name") or "Unnamed item"
+
+def tag_items(parsed_pages: List[Dict[str, Any]]) -> List[TaggedItem]:
+    out = []
+    for i, page in enumerate(parsed_pages, start=1):
+        icons = page.get("icons") or []
+        for item in page.get("items") or []:
+            text = _item_text(item)
+            out.append(TaggedItem(
+                page=page.get("page") or i,
+                item=item,
+                tags=item_tags(item, icons),
+                icons=icons_for_item(item, icons),
+                meat=is_meat(text),
+                non_vegan_extra=is_non_vegan_extra(text),
+                name_words=[w for w in tokens(item.get("name") or "") if w not in STOPWORDS and w not in PROFILE_ALIASES and w not in PROFILE_GROUPS],
+            ))
+    return out
+
+def _targeted_items(question_tokens: Set[str], items: List[TaggedItem]) -> List[TaggedItem]:
+    # Items whose name words (minus stopwords) are mostly present in the question; failing that,
+    # for questions that aren't about the whole menu, items sharing any distinctive word ("the cake")
+    strong, weak = [], []
+    for entry in items:
+        if not entry.name_words:
+            continue
+        hits = sum(1 for w in entry.name_words if w in question_tokens)
+        if hits / len(entry.name_words) >= 0.6:
+            strong.append(entry)
+        elif hits:
+            weak.append(entry)
+    if strong or question_tokens & GENERAL_CUES:
+        return strong
+    return weak
+
+def menu_question_kind(question_tokens: Set[str]) -> Optional[str]:
+    # "every" | "choice" | None when the wording doesn't say which
+    if question_tokens & EVERY_CUES:
+        return "every"
+    if question_tokens & CHOICE_CUES or ({"can", "could"} & question_tokens and question_tokens & CHOICE_VERBS):
+        return "choice"
+    if "menu" in question_tokens:
+        return "every"
+    return None
+
+def assess_item(entry: TaggedItem, allergens: Set[str], diets: Set[str]):
+    # → ("unsafe" | "unknown" | "safe", reasons, citations)
+    item, tags, name = entry.item, entry.tags, entry.name
+    reasons: List[str] = []
+    citations: List[Dict[str, Any]] = []
+    bbox = item.get("bbox") or [0, 0, 0, 0]
+
+    for label in sorted(allergens & set(tags["allergens"])):
+        evidence = tags["evidence"].get(label)
+        if evidence:
+            reasons.append(f"{name} contains {LABEL_TEXT[label]} ({', '.join(evidence)})")
+            citations.append({"page": entry.page, "bbox": bbox, "type": "item", "text": f"{name}: {', '.join(evidence)}"})
+        else:
+            reasons.append(f"{name} is marked with a {LABEL_TEXT[label]} icon")
+    for icon in entry.icons:
+        if icon.get("label") in allergens:
+            citations.append({"page": entry.page, "bbox": icon["bbox"], "type": "icon", "text": f"{LABEL_TEXT[icon['label']]} icon"})
+
+    if diets & {"vegetarian", "vegan"} and entry.meat:
+        reasons.append(f"{name} contains meat or fish")
+    if "vegan" in diets and "vegan" not in tags["diets"]:
+        animal = sorted({"dairy", "egg"} & set(tags["allergens"]))
+        if animal or entry.non_vegan_extra:
+            reasons.append(f"{name} is not vegan ({', '.join(animal) or 'honey'})")
+
+    if reasons:
+        return "unsafe", reasons, citations
+    if not item.get("ingredients") and not tags["icons"]:
+        return "unknown", [f"{name} lists no ingredients"], citations
+    missing_diets = [d for d in diets if d not in tags["diets"]]
+    if missing_diets:
+        return "unknown", [f"{name} is not marked {', '.join(missing_diets)}"], citations
+    return "safe", [], citations
+
+def answer_locally(items: List[TaggedItem], allergens: List[str], diets: List[str],
+                   question: str, sodium_limit: Optional[int] = None) -> Tuple[Optional[Dict[str, Any]], float]:
+    question_tokens = set(tokens(question))
+    terms = list(allergens) + list(diets)
+    wanted = {label for t in terms for label in canonical_labels(t)} | labels_mentioned(question)
+    # Diets count too: "halal" or "low-fodmap" has no lexicon, "gluten-free" maps to gluten
+    unrecognized = [t for t in terms if t.strip() and not set(canonical_labels(t)) & set(ALLERGEN_LABELS + DIET_LABELS)]
+    wanted_allergens = wanted & set(ALLERGEN_LABELS)
+    wanted_diets = wanted & set(DIET_LABELS)
+
+    confidence = 0.9
+    if not wanted_allergens and not wanted_diets:
+        return None, 0.0
+    if unrecognized:
+        confidence = min(confidence, 0.4)   # no lexicon for it; the model may know better
+    if question_tokens & UNSUPPORTED_TOPICS:
+        confidence = min(confidence, 0.2)
+
+    if not items:
+        return None, 0.0
+    targeted = _targeted_items(question_tokens, items)
+    if not targeted and not question_tokens & GENERAL_CUES:
+        confidence = min(confidence, 0.5)   # probably about a dish we failed to recognise
+    scope = targeted or items
+
+    safe, unsafe, unknown = [], [], []
+    reasons: List[str] = []
+    citations: List[Dict[str, Any]] = []
+    for entry in scope:
+        verdict, item_reasons, item_citations = assess_item(entry, wanted_allergens, wanted_diets)
+        {"safe": safe, "unsafe": unsafe, "unknown": unknown}[verdict].append(entry.name)
+        reasons.extend(item_reasons)
+        citations.extend(item_citations)
+    if unknown:
+        confidence = min(confidence, 0.9 - 0.4 * len(unknown) / len(scope))
+
+    restrictions = ", ".join(LABEL_TEXT[l] for l in sorted(wanted_allergens | wanted_diets))
+    if targeted:
+        if unsafe:
+            result = "unsafe"
+            summary = f"⚠️ UNSAFE: {', '.join(unsafe)} conflicts with your profile ({restrictions})."
+        elif unknown:
+            result = "ask_server"
+            summary = f"❓ Not enough detail on the menu to confirm {', '.join(unknown)} for {restrictions}; ask your server."
+        else:
+            result = "safe"
+            summary = f"✅ SAFE: {', '.join(safe)} fits your profile ({restrictions}) based on the listed ingredients and icons."
+            reasons.append(f"No conflict with {restrictions} in the listed ingredients or icons for {', '.join(safe)}")
+        alternatives = [] if result == "safe" else _alternatives(items, targeted, wanted_allergens, wanted_diets)
+    else:
+        alternatives = safe
+        kind = menu_question_kind(question_tokens)
+        if kind is None:
+            confidence = min(confidence, 0.5)   # answered conservatively, but the model should decide
+        if kind == "choice":
+            if safe:
+                result = "safe"
+                summary = f"✅ {len(safe)} of {len(scope)} items fit your profile ({restrictions})."
+            elif unknown:
+                result = "ask_server"
+                summary = f"❓ No item could be confirmed free of {restrictions}; ask your server."
+            else:
+                result = "unsafe"
+                summary = f"⚠️ UNSAFE: every item conflicts with your profile ({restrictions})."
+        elif unsafe:
+            result = "unsafe"
+            summary = f"⚠️ UNSAFE: {len(unsafe)} of {len(scope)} items conflict with your profile ({restrictions}): {', '.join(unsafe)}."
+        elif unknown:
+            result = "ask_server"
+            summary = f"❓ Not every item could be confirmed free of {restrictions}; ask your server."
+        else:
+            result = "safe"
+            summary = f"✅ All {len(scope)} items fit your profile ({restrictions})."
+    if sodium_limit is not None and result != "unsafe":
+        confidence = min(confidence, 0.4)   # sodium isn't on the menu; only a conflict stands without it
+    summary += " Always confirm preparation with your server."
+
+    return {
+        "result": result,
+        "reasons": reasons,
+        "alternatives": alternatives,
+        "citations": citations,
+        "summary": summary,
+    }, round(confidence, 2)
+
+def _alternatives(items: List[TaggedItem], targeted: List[TaggedItem], allergens: Set[str], diets: Set[str],
+                  limit: int = 5) -> List[str]:
+    targeted_ids = {id(entry) for entry in targeted}
+    out = []
+    for entry in items:
+        if id(entry) in targeted_ids:
+            continue
+        if assess_item(entry, allergens, diets)[0] == "safe":
+            out.append(entry.name)
+            if len(out) >= limit:
+                break
+    return out
@@ -0,0 +1,40 @@
+# Leveled, structured logging: one JSON object per line on stderr. Quiet by default
+# (LOG_LEVEL=WARNING); keyword fields passed via `extra=` become top-level keys.
+import json
+import logging
+import sys
+
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        out.update({k: v for k, v in vars(record).items() if k not in _RESERVED})
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, default=str, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    # Human-readable variant for local development (LOG_FORMAT=text)
+    def format(self, record: logging.LogRecord) -> str:
+        fields = " ".join(f"{k}={v}" for k, v in vars(record).items() if k not in _RESERVED)
+        line = f"{record.levelname:<7} {record.name}: {record.getMessage()}"
+        if fields:
+            line += f"  {fields}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+def configure_logging(level: str = "WARNING", fmt: str = "json") -> logging.Logger:
+    root = logging.getLogger("allerlens")
+    root.setLevel(level.upper())
+    root.propagate = False
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(TextFormatter() if fmt == "text" else JsonFormatter())
+    root.handlers = [handler]
+    return root
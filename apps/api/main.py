@@ -1,54 +1,218 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Literal, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any, AsyncIterator, Callable, Tuple, Union
 
 # Load env vars (OPENAI_API_KEY in apps/api/.env)
-import os, uuid, base64, json
+import os, uuid, base64, json, asyncio, time, logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 load_dotenv()
 
-from openai import OpenAI
-from PIL import Image
-from io import BytesIO
+from imaging import NormalizedImage, normalize_bytes, normalize_image, rescale_page_bboxes
+from parse_cache import ParseCache
+from allergens import canonical_labels, overlay_profile
+from local_qa import TaggedItem, answer_locally, labels_mentioned, tag_items
+from context_index import CONTEXT_LEGEND, MenuIndex, estimate_tokens
+from answer_cache import AnswerCache, canonical_profile
+from jobs import JobQueue, ParseJob, QueueFull, sse_event
+from matrix import MenuMatrix
+from uploads import UploadRejected, UploadSizeLimit, stream_to_disk
+from store import MenuStore, open_store
+from retention import Retention
+from page_reuse import PageMatcher, fingerprint
+from tiling import merge_tile_pages
+from llm_client import CircuitBreaker, ResilientClient, UpstreamError
+from json_stream import JSONObjectStream
+from menu_wire import EncodedBody, encode_pages, etag_matches
+from logs import configure_logging
+from metrics import Metrics
 
-# Optional PDF → image
-try:
-    from pdf2image import convert_from_path
-    PDF2IMAGE_AVAILABLE = True
-except Exception:
-    PDF2IMAGE_AVAILABLE = False
+# Optional PDF → image, imported on first use (or by the warm-up) to keep start-up fast
+def load_pdf2image():
+    try:
+        import pdf2image
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="pdf2image/poppler not available on server") from e
+    return pdf2image
+
+# ---- Logging & metrics ----
+# LOG_LEVEL=INFO logs one line per request stage; DEBUG adds prompts and raw model output
+configure_logging(os.getenv("LOG_LEVEL", "WARNING"), os.getenv("LOG_FORMAT", "json").lower())
+log = logging.getLogger("allerlens.api")
+METRICS = Metrics()  # per worker process
 
 # ---- App setup ----
-app = FastAPI(title="AllerLens API (o4-mini)", version="0.2.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    sweeper = asyncio.create_task(RETENTION.run(SWEEP_INTERVAL_SECONDS))
+    warmup = asyncio.create_task(warm_up()) if WARMUP_ENABLED else None
+    try:
+        yield
+    finally:
+        sweeper.cancel()
+        if warmup is not None:
+            warmup.cancel()
+        await PARSE_JOBS.shutdown()
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+app = FastAPI(title="AllerLens API (o4-mini)", version="0.2.0", lifespan=lifespan)
 
 # ---- OpenAI setup ----
 OPENAI_MODEL_VLM = "gpt-4o-mini"   # vision + text
 OPENAI_MODEL_TEXT = "gpt-4o-mini"  # text reasoning for MVP
 AI_MODE = os.getenv("AI_MODE", "real").lower()  # "real" or "mock"
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None  # e.g. bench/openai_stub.py for load tests
+PARSE_CONCURRENCY = max(1, int(os.getenv("PARSE_CONCURRENCY", "4")))  # pages parsed in parallel
+PDF_DPI = 200
+RASTER_WORKERS = max(1, int(os.getenv("RASTER_WORKERS", "2")))  # PDF pages rendered ahead of the parser
+RASTER_POOL = ThreadPoolExecutor(max_workers=RASTER_WORKERS, thread_name_prefix="raster")
+# Vision payload normalization (see imaging.py)
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "2048"))
+IMAGE_TARGET_BYTES = int(os.getenv("IMAGE_TARGET_BYTES", "1000000"))
+IMAGE_CROP_MARGINS = os.getenv("IMAGE_CROP_MARGINS", "0").lower() in ("1", "true", "yes")
+# Pages larger than IMAGE_MAX_EDGE can be parsed as overlapping full-resolution tiles instead
+PARSE_TILES = os.getenv("PARSE_TILES", "0").lower() in ("1", "true", "yes")
+TILE_EDGE = int(os.getenv("TILE_EDGE", "1536"))  # original px per tile side
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", "192"))  # px shared by neighbouring tiles
+NORMALIZE_OPTS = {
+    "max_edge": IMAGE_MAX_EDGE,
+    "target_bytes": IMAGE_TARGET_BYTES,
+    "crop_margins": IMAGE_CROP_MARGINS,
+    "tile_edge": TILE_EDGE if PARSE_TILES else 0,
+    "tile_overlap": TILE_OVERLAP,
+}
+# Account quotas for every parse and Q&A call (see llm_client.py). The token buckets live in each
+# process, so every worker enforces its share; uvicorn also takes its worker count from WEB_CONCURRENCY
+API_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+OPENAI_RPM = max(1, int(os.getenv("OPENAI_RPM", "500")) // API_WORKERS)
+OPENAI_TPM = max(1, int(os.getenv("OPENAI_TPM", "200000")) // API_WORKERS)
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+OPENAI_BREAKER_THRESHOLD = int(os.getenv("OPENAI_BREAKER_THRESHOLD", "5"))  # consecutive failures
+OPENAI_BREAKER_RESET_SECONDS = float(os.getenv("OPENAI_BREAKER_RESET_SECONDS", "30"))
+IMAGE_TOKEN_ESTIMATE = 1500  # rate-limit estimate for one page image; settled against actual usage
 
-print(f"🤖 AI_MODE: {AI_MODE}")
-
-if AI_MODE == "real":
+def open_openai_clients() -> Tuple[Any, Any]:
+    # Runs on the first model call or in the warm-up; importing openai alone takes ~0.4 s
     if not OPENAI_API_KEY:
-        raise RuntimeError("OPENAI_API_KEY is missing. Set it in apps/api/.env or export it in your shell.")
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    print("✅ OpenAI client initialized for REAL mode")
-else:
-    client = None
-    print("🎭 Running in MOCK mode - no OpenAI API calls will be made")
-
-# ---- Storage (MVP in-memory) ----
-MENUS: Dict[str, Dict[str, Any]] = {}  # {menu_id: {"path":..., "parsed":[...]}}
+        raise UpstreamError(503, "OPENAI_API_KEY is missing. Set it in apps/api/.env or export it in your shell.")
+    from openai import AsyncOpenAI, OpenAI
+
+    # Retries are done by LLM below, which also rate-limits them
+    return (
+        OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0),
+        AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0),
+    )
+
+if AI_MODE != "real":
+    log.warning("AI_MODE=mock: no OpenAI API calls will be made")
+elif not OPENAI_API_KEY:
+    log.error("OPENAI_API_KEY is missing: model calls fail with 503 and /readyz reports not ready")
+
+LLM = ResilientClient(
+    connect=open_openai_clients if AI_MODE == "real" else None,
+    requests_per_minute=OPENAI_RPM,
+    tokens_per_minute=OPENAI_TPM,
+    max_retries=OPENAI_MAX_RETRIES,
+    breaker=CircuitBreaker(OPENAI_BREAKER_THRESHOLD, OPENAI_BREAKER_RESET_SECONDS),
+)
+
+# ---- Storage ----
 TMP = "/tmp"
+# "sqlite" (shared by all workers, survives restarts) or "memory" (single process)
+MENU_STORE = os.getenv("MENU_STORE", "sqlite").lower()
+STORE: MenuStore = open_store(MENU_STORE, os.getenv("MENU_STORE_PATH", os.path.join(TMP, "allerlens_menus.db")))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 256 * 1024
+
+@dataclass
+class MenuView:
+    # Per-process structures derived from one parse version of a menu
+    version: int
+    pages: List[Dict[str, Any]]
+    matrix: "MenuMatrix"
+    index: "MenuIndex"
+    qa_items: List[TaggedItem]  # item tags for the local Q&A engine
+    wire: Dict[tuple, EncodedBody] = field(default_factory=dict)  # GET bodies by (format, page)
+
+VIEWS: "OrderedDict[str, MenuView]" = OrderedDict()  # LRU, bounded by MAX_VIEWS
+MAX_VIEWS = int(os.getenv("MAX_VIEWS", "256"))
+TOUCH_INTERVAL_SECONDS = 60  # accessed_at is refreshed at most this often per menu
+
+def cache_view(menu_id: str, view: MenuView) -> MenuView:
+    VIEWS[menu_id] = view
+    VIEWS.move_to_end(menu_id)
+    while len(VIEWS) > MAX_VIEWS:
+        VIEWS.popitem(last=False)
+    return view
+
+def build_view(version: int, pages: List[Dict[str, Any]]) -> MenuView:
+    return MenuView(version=version, pages=pages, matrix=MenuMatrix.build(pages), index=MenuIndex.build(pages),
+                    qa_items=tag_items(pages))
+
+def load_view(menu_id: str) -> Optional[MenuView]:
+    # Rebuilt only when another worker (or a restart) has stored a newer parse version
+    record = STORE.get(menu_id)
+    if not record or not record["version"]:
+        VIEWS.pop(menu_id, None)
+        return None
+    if record["accessed_at"] + TOUCH_INTERVAL_SECONDS < time.time():
+        STORE.touch(menu_id)
+    view = VIEWS.get(menu_id)
+    if view is None or view.version != record["version"]:
+        pages = STORE.get_pages(menu_id)
+        if pages is None:
+            return None
+        view = build_view(record["version"], pages)
+    return cache_view(menu_id, view)
+
+# ---- Retention ----
+def forget_menu(menu_id: str):
+    VIEWS.pop(menu_id, None)
+    ANSWER_CACHE.invalidate(menu_id)
+
+RETENTION = Retention(
+    STORE,
+    TMP,
+    ttl_seconds=float(os.getenv("MENU_TTL_SECONDS", str(24 * 3600))),
+    max_menus=int(os.getenv("MAX_MENUS", "1000")),
+    max_bytes=int(os.getenv("MAX_MENU_BYTES", str(2 * 1024 ** 3))),
+    on_evict=forget_menu,
+)
+SWEEP_INTERVAL_SECONDS = float(os.getenv("SWEEP_INTERVAL_SECONDS", "300"))
+
+def require_view(menu_id: str) -> MenuView:
+    view = load_view(menu_id)
+    if view is None:
+        raise HTTPException(status_code=400, detail="Menu not parsed yet. Call /menus/{id}/parse first.")
+    return view
+
+# ---- Parse cache (shared on disk between workers) ----
+PARSE_PROMPT_VERSION = "2"  # bump when the parse prompt or schema changes meaning
+PARSE_CACHE_ENABLED = os.getenv("PARSE_CACHE", "1").lower() in ("1", "true", "yes")
+PARSE_CACHE = ParseCache(
+    os.getenv("PARSE_CACHE_DIR", os.path.join(TMP, "allerlens_parse_cache")),
+    max_bytes=int(os.getenv("PARSE_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+) if PARSE_CACHE_ENABLED else None
+# Revised uploads (previous_menu_id) reuse pages whose perceptual hash differs by at most this many bits
+# -1: reuse only byte-identical pages. >= 0 also reuses perceptually similar pages, which can miss a
+# changed ingredient (and its allergen) that doesn't move the 32×32 hash; see page_reuse.py
+PAGE_MATCH_MAX_DISTANCE = int(os.getenv("PAGE_MATCH_MAX_DISTANCE", "-1"))
+
+# ---- Local Q&A fast path ----
+LOCAL_QA_ENABLED = os.getenv("LOCAL_QA", "1").lower() in ("1", "true", "yes")
+LOCAL_QA_MIN_CONFIDENCE = float(os.getenv("LOCAL_QA_MIN_CONFIDENCE", "0.75"))  # below this, ask the model
+QA_CONTEXT_TOKENS = int(os.getenv("QA_CONTEXT_TOKENS", "3000"))  # menu context budget per /qa prompt
+QA_BATCH_CONTEXT_TOKENS = int(os.getenv("QA_BATCH_CONTEXT_TOKENS", "6000"))  # shared context per /qa/batch call
+QA_BATCH_MAX_QUESTIONS = max(1, int(os.getenv("QA_BATCH_MAX_QUESTIONS", "8")))  # questions per model call
+ANSWER_CACHE = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "2048")),
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "900")),
+)
 
 # ---- Schemas ----
 PARSE_SCHEMA = {
@@ -164,53 +328,123 @@ QA_SCHEMA = {
     "additionalProperties": False
 }
 
+# Several questions answered in one call; "id" ties each answer back to its question
+QA_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "answers": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": {"type": "integer"}, **QA_SCHEMA["properties"]},
+                "required": ["id"] + QA_SCHEMA["required"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["answers"],
+    "additionalProperties": False
+}
+
 # ---- Helpers ----
 def save_bytes(path: str, data: bytes):
     os.makedirs(os.path.dirname(path), exist_ok=True)
     with open(path, "wb") as f:
         f.write(data)
 
+def read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
 def img_bytes_to_base64(img_bytes: bytes) -> str:
     return base64.b64encode(img_bytes).decode("utf-8")
 
-def pdf_to_images(pdf_path: str) -> List[bytes]:
-    if not PDF2IMAGE_AVAILABLE:
-        raise HTTPException(status_code=500, detail="pdf2image/poppler not available on server")
-    pages = convert_from_path(pdf_path, dpi=200)
-    out: List[bytes] = []
-    for im in pages:
-        buf = BytesIO()
-        im.convert("RGB").save(buf, format="JPEG", quality=92)
-        out.append(buf.getvalue())
-    return out
-
-def call_o4mini_parse(image_bytes: bytes, page_no: int, user_allergies: List[str] = None) -> Dict[str, Any]:
-    # Enhanced prompt with allergy focus
-    allergy_context = ""
-    if user_allergies and len(user_allergies) > 0:
-        allergy_list = ", ".join(user_allergies)
-        allergy_context = f"\n\nIMPORTANT: The user has these allergies: {allergy_list}. Pay special attention to detecting these allergens in menu items and mark them clearly in the icons section with high confidence."
-    
+def pdf_page_count(pdf_path: str) -> int:
+    return int(load_pdf2image().pdfinfo_from_path(pdf_path)["Pages"])
+
+def render_pdf_page(pdf_path: str, page_no: int) -> NormalizedImage:
+    # Rasterize a single page so only that page's bitmap is ever held in memory
+    with METRICS.timer("pdf_rasterize"):
+        pages = load_pdf2image().convert_from_path(pdf_path, dpi=PDF_DPI, first_page=page_no, last_page=page_no)
+    try:
+        with METRICS.timer("image_encode"):
+            return normalize_image(pages[0], **NORMALIZE_OPTS)
+    finally:
+        pages[0].close()
+
+def load_image_file(path: str) -> NormalizedImage:
+    data = read_bytes(path)
+    with METRICS.timer("image_encode"):
+        return normalize_bytes(data, **NORMALIZE_OPTS)
+
+PageSource = AsyncIterator[Tuple[int, Union[NormalizedImage, Exception]]]
+
+async def iter_pdf_pages(pdf_path: str, total: Optional[int] = None) -> PageSource:
+    # Render at most RASTER_WORKERS pages ahead on the raster pool and yield them in page order.
+    # A page that fails to render is yielded as its exception so the caller can report it.
+    loop = asyncio.get_running_loop()
+    if total is None:
+        total = await asyncio.to_thread(pdf_page_count, pdf_path)
+    log.info("rasterizing pdf", extra={"pages": total})
+    pending = deque()
+    next_page = 1
+    try:
+        while next_page <= total or pending:
+            while next_page <= total and len(pending) < RASTER_WORKERS:
+                pending.append((next_page, loop.run_in_executor(RASTER_POOL, render_pdf_page, pdf_path, next_page)))
+                next_page += 1
+            page_no, fut = pending.popleft()
+            try:
+                yield page_no, await fut
+            except Exception as e:
+                yield page_no, e
+    finally:
+        for _, fut in pending:
+            fut.cancel()
+
+async def iter_image_file(path: str) -> PageSource:
+    try:
+        page = await asyncio.to_thread(load_image_file, path)
+    except Exception as e:
+        yield 1, e
+        return
+    log.info("image normalized", extra={"bytes_in": page.original_bytes, "bytes_out": len(page.data)})
+    yield 1, page
+
+def load_model_json(resp) -> Dict[str, Any]:
+    # Strict-schema replies should always parse; a truncated or refused one is an upstream error
+    try:
+        with METRICS.timer("json_decode"):
+            return json.loads(resp.choices[0].message.content)
+    except (TypeError, ValueError, IndexError) as e:
+        raise UpstreamError(502, f"Model returned an unreadable response: {e}") from e
+
+def record_usage(kind: str, resp) -> None:
+    usage = getattr(resp, "usage", None)
+    for name in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        value = getattr(usage, name, None)
+        if isinstance(value, int):
+            METRICS.inc(f"openai_{name}.{kind}", value)
+    METRICS.inc(f"openai_requests.{kind}")
+    if log.isEnabledFor(logging.DEBUG) and resp.choices:  # the usage chunk of a stream has no choices
+        log.debug("model response", extra={"kind": kind, "content": resp.choices[0].message.content})
+
+async def call_o4mini_parse(image_bytes: bytes, page_no: int, mime: str = "image/jpeg", tile: bool = False) -> Dict[str, Any]:
+    # Profile-agnostic: every allergen/diet icon is extracted so one parse serves every diner;
+    # per-user flags come from overlay_profile over the stored pages.
     prompt = (
         "You are a structured menu parser. Return STRICT JSON with keys: page, items, icons, tables. "
-        "Use pixel coordinates for bbox. Be conservative; omit if unsure."
-        f"{allergy_context}"
+        "Use pixel coordinates for bbox. Be conservative; omit if unsure. "
+        "List each item's ingredients as printed, and report every allergen or diet icon you see."
     )
-    b64 = img_bytes_to_base64(image_bytes)
-    
-    print(f"\n{'='*60}")
-    print(f"🔍 PARSING MENU PAGE {page_no}")
-    print(f"{'='*60}")
-    print(f"📝 Prompt: {prompt}")
-    print(f"🖼️  Image size: {len(image_bytes)} bytes")
-    print(f"🤖 Model: {OPENAI_MODEL_VLM}")
-    print(f"🌡️  Temperature: 0.1")
-    print(f"🎭 AI_MODE: {AI_MODE}")
-    print(f"🚨 User Allergies: {user_allergies if user_allergies else 'None specified'}")
+    if tile:
+        prompt += (
+            " The image is one tile of a larger page: also report items cut off at its edges, "
+            "with the bbox of the part you can see."
+        )
     
     # Return mock response if in mock mode
     if AI_MODE == "mock":
-        print(f"🎭 MOCK MODE: Returning mock response...")
         mock_response = {
             "page": page_no,
             "items": [
@@ -244,27 +478,31 @@ def call_o4mini_parse(image_bytes: bytes, page_no: int, user_allergies: List[str
             "tables": []
         }
         
-        print(f"🎭 Mock response:")
-        print(f"{'-'*40}")
-        print(json.dumps(mock_response, indent=2))
-        print(f"{'-'*40}")
-        print(f"📋 Mock: {len(mock_response.get('items', []))} menu items")
-        print(f"🏷️  Mock: {len(mock_response.get('icons', []))} icons")
-        print(f"📊 Mock: {len(mock_response.get('tables', []))} tables")
-        
         return mock_response
     
-    # Real API call
-    try:
-        print(f"📡 Making OpenAI API call...")
-        resp = client.chat.completions.create(
+    cache_key = None
+    if PARSE_CACHE is not None:
+        cache_key = ParseCache.key(image_bytes, OPENAI_MODEL_VLM, PARSE_PROMPT_VERSION, prompt)
+        cached = await asyncio.to_thread(PARSE_CACHE.get, cache_key)
+        if cached is not None:
+            log.info("parse cache hit", extra={"page": page_no, "key": cache_key[:12]})
+            cached["page"] = page_no
+            return cached
+
+    # Real API call; UpstreamError propagates so the page is reported failed, never invented
+    with METRICS.timer("image_encode"):
+        b64 = img_bytes_to_base64(image_bytes)
+    log.info("parsing page", extra={"page": page_no, "image_bytes": len(image_bytes), "model": OPENAI_MODEL_VLM})
+    with METRICS.timer("model_call.parse"):
+        resp = await LLM.acreate(
+            estimated_tokens=estimate_tokens(prompt) + IMAGE_TOKEN_ESTIMATE + 2000,
             model=OPENAI_MODEL_VLM,
             messages=[
                 {
                     "role": "user",
                     "content": [
                         {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}},
+                        {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{b64}"}},
                     ],
                 }
             ],
@@ -274,79 +512,156 @@ def call_o4mini_parse(image_bytes: bytes, page_no: int, user_allergies: List[str
             },
             temperature=0.1,
         )
-        
-        print(f"✅ API Response received!")
-        print(f"📊 Usage: {resp.usage}")
-        print(f"🎯 Response content:")
-        print(f"{'-'*40}")
-        print(resp.choices[0].message.content)
-        print(f"{'-'*40}")
-        
-        parsed_response = json.loads(resp.choices[0].message.content)
-        print(f"📋 Parsed {len(parsed_response.get('items', []))} menu items")
-        print(f"🏷️  Found {len(parsed_response.get('icons', []))} icons")
-        print(f"📊 Found {len(parsed_response.get('tables', []))} tables")
-        
-        return parsed_response
-        
-    except Exception as e:
-        print(f"❌ OpenAI API Error: {e}")
-        print(f"🔄 Returning fallback mock response...")
-        
-        fallback_response = {
-            "page": page_no,
-            "items": [
-                {
-                    "name": "Sample Menu Item",
-                    "ingredients": ["Sample ingredient 1", "Sample ingredient 2"],
-                    "price": 12.99,
-                    "section": "Main Course",
-                    "bbox": [100, 100, 300, 150]
-                }
-            ],
-            "icons": [
-                {
-                    "label": "gluten",
-                    "bbox": [50, 50, 80, 80],
-                    "confidence": 0.8
-                }
-            ],
-            "tables": []
-        }
-        
-        print(f"🎭 Fallback response:")
-        print(f"{'-'*40}")
-        print(json.dumps(fallback_response, indent=2))
-        print(f"{'-'*40}")
-        
-        return fallback_response
+    
+    record_usage("parse", resp)
+    parsed_response = load_model_json(resp)
+    log.info("page parsed", extra={
+        "page": page_no,
+        "items": len(parsed_response.get("items", [])),
+        "icons": len(parsed_response.get("icons", [])),
+        "tables": len(parsed_response.get("tables", [])),
+    })
+    
+    if cache_key is not None:
+        try:
+            await asyncio.to_thread(PARSE_CACHE.put, cache_key, parsed_response)
+        except OSError as e:
+            log.warning("parse cache write failed", extra={"error": str(e)})
+    return parsed_response
+
+def is_pdf(path: str) -> bool:
+    return path.lower().endswith(".pdf")
+
+async def count_pages(path: str) -> int:
+    return await asyncio.to_thread(pdf_page_count, path) if is_pdf(path) else 1
+
+def page_source(path: str, total: Optional[int] = None) -> PageSource:
+    if is_pdf(path):
+        return iter_pdf_pages(path, total)
+    return iter_image_file(path)
 
-def call_o4mini_answer(parsed_pages: List[Dict[str, Any]], profile: Profile, question: str) -> Dict[str, Any]:
+async def parse_page(page_no: int, page: NormalizedImage) -> Dict[str, Any]:
+    # Bboxes come back in original-page pixels. A tiled page is parsed tile by tile, concurrently
+    # (the shared rate limiter paces them), and fails as a whole if any tile fails.
+    # Mock replies ignore the image, so mock mode always parses the whole page.
+    if not page.tiles or AI_MODE == "mock":
+        parsed = rescale_page_bboxes(await call_o4mini_parse(page.data, page_no=page_no, mime=page.mime), page)
+        parsed["page"] = page_no  # the model sees one image and can't know its page number
+        return parsed
+    with METRICS.timer("parse_tiled"):
+        parsed_tiles = await asyncio.gather(*(
+            call_o4mini_parse(tile.data, page_no=page_no, mime=tile.mime, tile=True) for tile in page.tiles
+        ))
+    parsed, merged = merge_tile_pages(page_no, [
+        rescale_page_bboxes(result, tile) for result, tile in zip(parsed_tiles, page.tiles)
+    ])
+    METRICS.inc("tiles_parsed", len(page.tiles))
+    METRICS.inc("tile_duplicates_merged", merged)
+    log.info("tiled page merged", extra={"page": page_no, "tiles": len(page.tiles), "merged": merged, "items": len(parsed["items"])})
+    return parsed
+
+PageCallback = Callable[[int, Optional[Dict[str, Any]], Optional[str]], None]
+
+async def parse_pages(pages: PageSource, on_page: Optional[PageCallback] = None, matcher: Optional[PageMatcher] = None):
+    # Parse pages as they arrive, at most PARSE_CONCURRENCY at a time. The rasterizer is only
+    # pulled once a parse slot is free, so rendering overlaps model calls without running ahead.
+    # Results keep page order and a failing page is reported instead of discarding the rest.
+    # on_page(page_no, result, error) fires as each page finishes, in completion order.
+    # With a matcher, pages unchanged since the previous menu version reuse its stored parse.
+    # Returns (parsed pages, failed pages, one fingerprint per parsed page).
+    sem = asyncio.Semaphore(PARSE_CONCURRENCY)
+    tasks: List[Tuple[int, asyncio.Future]] = []
+    failed_pages: List[Dict[str, Any]] = []
+    prints: Dict[int, Dict[str, Any]] = {}
+
+    async def parse_one(page_no: int, page: NormalizedImage) -> Dict[str, Any]:
+        try:
+            parsed = await parse_page(page_no, page)
+        except Exception as e:
+            if on_page:
+                on_page(page_no, None, str(e))
+            raise
+        finally:
+            sem.release()
+        if on_page:
+            on_page(page_no, parsed, None)
+        return parsed
+
+    try:
+        source = pages.__aiter__()
+        while True:
+            # Take the slot first: resuming the source is what lets it render further ahead
+            await sem.acquire()
+            try:
+                page_no, page = await source.__anext__()
+            except StopAsyncIteration:
+                sem.release()
+                break
+            if isinstance(page, Exception):
+                sem.release()
+                log.warning("page failed to render", extra={"page": page_no, "error": str(page)})
+                failed_pages.append({"page": page_no, "error": str(page)})
+                if on_page:
+                    on_page(page_no, None, str(page))
+                continue
+            prints[page_no] = fingerprint(page_no, page)
+            reused = matcher.match(prints[page_no]) if matcher else None
+            if reused is not None:
+                sem.release()
+                prints[page_no]["reused_from"], result = reused
+                METRICS.inc("pages_reused")
+                if on_page:
+                    on_page(page_no, result, None)
+                done = asyncio.get_running_loop().create_future()
+                done.set_result(result)
+                tasks.append((page_no, done))
+                continue
+            tasks.append((page_no, asyncio.create_task(parse_one(page_no, page))))
+    except BaseException:
+        for _, task in tasks:
+            task.cancel()
+        raise
+
+    parsed_pages: List[Dict[str, Any]] = []
+    page_prints: List[Dict[str, Any]] = []
+    for page_no, task in tasks:
+        try:
+            parsed_pages.append(await task)
+            page_prints.append(prints[page_no])
+        except Exception as e:
+            log.warning("page failed to parse", extra={"page": page_no, "error": str(e)})
+            failed_pages.append({"page": page_no, "error": str(e)})
+    failed_pages.sort(key=lambda f: f["page"])
+    return parsed_pages, failed_pages, page_prints
+
+def profile_labels(profile: Profile, question: str) -> List[str]:
+    labels = {l for t in profile.allergens + profile.diets for l in canonical_labels(t)} | labels_mentioned(question)
+    return sorted(labels)
+
+def qa_prompt(index: MenuIndex, profile: Profile, question: str) -> Tuple[str, str]:
+    # (system, user) messages for one question; shared by /qa and /qa/stream
     sys = (
         "You are a precise dining safety analyst. Use ONLY the provided parsed menu context. "
-        "Return STRICT JSON matching the schema."
+        "Return STRICT JSON matching the schema. "
+        f"{CONTEXT_LEGEND}"
     )
+    context = index.pack(question, profile_labels(profile, question), QA_CONTEXT_TOKENS)
     user = (
         f"user_profile: {profile.model_dump()}\n"
         f"question: {question}\n"
-        f"context_pages: {json.dumps(parsed_pages)[:15000]}"
+        f"context: {context}"
     )
+    return sys, user
+
+def call_o4mini_answer(index: MenuIndex, profile: Profile, question: str) -> Dict[str, Any]:
+    sys, user = qa_prompt(index, profile, question)
     
-    print(f"\n{'='*60}")
-    print(f"🤔 ANALYZING MENU SAFETY")
-    print(f"{'='*60}")
-    print(f"👤 User Profile: {profile.model_dump()}")
-    print(f"❓ Question: {question}")
-    print(f"📄 Context pages: {len(parsed_pages)} pages")
-    print(f"🤖 Model: {OPENAI_MODEL_TEXT}")
-    print(f"🌡️  Temperature: 0.2")
-    print(f"📝 System prompt: {sys}")
-    print(f"💬 User prompt length: {len(user)} characters")
-    print(f"🎭 AI_MODE: {AI_MODE}")
+    log.info("asking model", extra={"entries": len(index), "prompt_tokens": estimate_tokens(user), "model": OPENAI_MODEL_TEXT})
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("qa prompt", extra={"system": sys, "user": user})
     
     # Return mock response if in mock mode
     if AI_MODE == "mock":
-        print(f"🎭 MOCK MODE: Returning mock analysis...")
         
         # Generate contextual mock response based on user allergies and question
         user_allergies_lower = [allergy.lower() for allergy in profile.allergens]
@@ -398,22 +713,12 @@ def call_o4mini_answer(parsed_pages: List[Dict[str, Any]], profile: Profile, que
         mock_response["alternatives"] = [a for a in mock_response["alternatives"] if a]
         mock_response["citations"] = [c for c in mock_response["citations"] if c]
         
-        print(f"🎭 Mock response:")
-        print(f"{'-'*40}")
-        print(json.dumps(mock_response, indent=2))
-        print(f"{'-'*40}")
-        print(f"🔍 Mock result: {mock_response.get('result', 'unknown')}")
-        print(f"📝 Mock summary: {mock_response.get('summary', 'No summary')}")
-        print(f"📋 Mock reasons: {len(mock_response.get('reasons', []))} items")
-        print(f"🔄 Mock alternatives: {len(mock_response.get('alternatives', []))} items")
-        print(f"📚 Mock citations: {len(mock_response.get('citations', []))} items")
-        
         return mock_response
     
     # Real API call
-    try:
-        print(f"📡 Making OpenAI API call...")
-        resp = client.chat.completions.create(
+    with METRICS.timer("model_call.qa"):
+        resp = LLM.create(
+            estimated_tokens=estimate_tokens(sys) + estimate_tokens(user) + 800,
             model=OPENAI_MODEL_TEXT,
             messages=[
                 {"role": "system", "content": sys},
@@ -425,143 +730,565 @@ def call_o4mini_answer(parsed_pages: List[Dict[str, Any]], profile: Profile, que
             },
             temperature=0.2,
         )
-        
-        print(f"✅ API Response received!")
-        print(f"📊 Usage: {resp.usage}")
-        print(f"🎯 Response content:")
-        print(f"{'-'*40}")
-        print(resp.choices[0].message.content)
-        print(f"{'-'*40}")
-        
-        parsed_response = json.loads(resp.choices[0].message.content)
-        print(f"🔍 Analysis result: {parsed_response.get('result', 'unknown')}")
-        print(f"📝 Summary: {parsed_response.get('summary', 'No summary')}")
-        print(f"📋 Reasons: {len(parsed_response.get('reasons', []))} items")
-        print(f"🔄 Alternatives: {len(parsed_response.get('alternatives', []))} items")
-        print(f"📚 Citations: {len(parsed_response.get('citations', []))} items")
-        
-        return parsed_response
-        
+    
+    record_usage("qa", resp)
+    return load_model_json(resp)
+
+def call_o4mini_answer_batch(index: MenuIndex, entries: List[Tuple[str, Profile]]) -> List[Dict[str, Any]]:
+    # One model call for several (question, profile) pairs sharing one packed menu context
+    if AI_MODE == "mock" or len(entries) == 1:
+        return [call_o4mini_answer(index, profile, question) for question, profile in entries]
+
+    sys = (
+        "You are a precise dining safety analyst. Use ONLY the provided parsed menu context. "
+        "Answer every numbered question for its own user_profile, independently of the others. "
+        "Return STRICT JSON matching the schema with one answer per question id. "
+        f"{CONTEXT_LEGEND}"
+    )
+    labels = sorted({l for question, profile in entries for l in profile_labels(profile, question)})
+    context = index.pack(" ".join(q for q, _ in entries), labels, QA_BATCH_CONTEXT_TOKENS)
+    questions = "\n".join(
+        f"[{i}] user_profile: {profile.model_dump()} question: {question}"
+        for i, (question, profile) in enumerate(entries)
+    )
+    user = f"questions:\n{questions}\ncontext: {context}"
+
+    log.info("asking model (batch)", extra={"questions": len(entries), "context_tokens": estimate_tokens(context)})
+    with METRICS.timer("model_call.qa_batch"):
+        resp = LLM.create(
+            estimated_tokens=estimate_tokens(sys) + estimate_tokens(user) + 800 * len(entries),
+            model=OPENAI_MODEL_TEXT,
+            messages=[
+                {"role": "system", "content": sys},
+                {"role": "user", "content": user},
+            ],
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "QABatchResponse", "schema": QA_BATCH_SCHEMA, "strict": True},
+            },
+            temperature=0.2,
+        )
+    record_usage("qa_batch", resp)
+    try:
+        answers = {a.pop("id"): a for a in load_model_json(resp)["answers"]}
+    except (UpstreamError, KeyError, TypeError) as e:
+        log.warning("unusable batch response", extra={"error": str(e)})
+        answers = {}
+
+    # Anything the batch call dropped is asked on its own
+    return [
+        answers.get(i) or call_o4mini_answer(index, profile, question)
+        for i, (question, profile) in enumerate(entries)
+    ]
+
+# ---- Warm-up ----
+# Started by the lifespan hook once the server is accepting connections; /readyz waits for it so
+# an autoscaler only routes traffic to warm workers. Everything here is best effort.
+WARMUP_ENABLED = os.getenv("WARMUP", "1").lower() in ("1", "true", "yes")
+WARMUP_MENUS = int(os.getenv("WARMUP_MENUS", "16"))  # most recently used menus rebuilt into VIEWS
+WARMUP_TIMEOUT_SECONDS = 5.0
+WARMUP: Dict[str, Any] = {"status": "pending" if WARMUP_ENABLED else "disabled"}
+
+def warm_views(limit: int) -> int:
+    # Rebuilds menu views (matrix, index, allergen tagging) without touching accessed_at,
+    # so warming never changes what retention evicts
+    records = sorted((r for r in STORE.records() if r["version"]), key=lambda r: r["accessed_at"], reverse=True)
+    warmed = 0
+    for record in records[:limit]:
+        pages = STORE.get_pages(record["menu_id"])
+        if pages is not None:
+            cache_view(record["menu_id"], build_view(record["version"], pages))
+            warmed += 1
+    return warmed
+
+async def warm_up():
+    WARMUP["status"] = "running"
+    start = time.perf_counter()
+    steps: Dict[str, Any] = {}
+    if AI_MODE == "real" and OPENAI_API_KEY:
+        try:
+            await asyncio.to_thread(lambda: LLM.client)  # imports openai and builds both clients
+            # One cheap request per client leaves a kept-alive connection in each pool; any HTTP
+            # answer, even an error status, means the connection is open
+            sync_probe = LLM.client.with_options(timeout=WARMUP_TIMEOUT_SECONDS).models.list
+            async_probe = LLM.aclient.with_options(timeout=WARMUP_TIMEOUT_SECONDS).models.list
+            results = await asyncio.gather(asyncio.to_thread(sync_probe), async_probe(), return_exceptions=True)
+            reached = [not isinstance(r, Exception) or getattr(r, "status_code", None) is not None for r in results]
+            steps["openai"] = "connected" if all(reached) else "unreachable"
+        except Exception as e:
+            steps["openai"] = f"failed: {e}"
+    try:
+        await asyncio.to_thread(load_pdf2image)
+        steps["pdf2image"] = "ok"
+    except HTTPException:
+        steps["pdf2image"] = "unavailable"
+    try:
+        steps["menus"] = await asyncio.to_thread(warm_views, WARMUP_MENUS)
     except Exception as e:
-        print(f"❌ OpenAI API Error: {e}")
-        print(f"🔄 Returning fallback mock response...")
-        
-        fallback_response = {
-            "result": "ask_server",
-            "reasons": ["OpenAI API quota exceeded - please check billing"],
-            "alternatives": ["Contact server administrator for API access"],
-            "citations": [],
-            "summary": "Unable to analyze menu due to API quota limits. Please check OpenAI billing settings."
-        }
-        
-        print(f"🎭 Fallback response:")
-        print(f"{'-'*40}")
-        print(json.dumps(fallback_response, indent=2))
-        print(f"{'-'*40}")
-        
-        return fallback_response
+        steps["menus"] = f"failed: {e}"
+    WARMUP.update(status="done", seconds=round(time.perf_counter() - start, 3), steps=steps)
+    log.info("warm-up finished", extra={"seconds": WARMUP["seconds"], **steps})
 
 # ---- Routes ----
+@app.exception_handler(UpstreamError)
+async def upstream_error(request: Request, exc: UpstreamError):
+    headers = {"Retry-After": str(max(1, round(exc.retry_after)))} if exc.retry_after else None
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=headers)
+
 @app.get("/health")
 def health():
+    # Includes retention gauges (live menus, upload bytes on disk) and the model circuit state
+    return {"status": "ok", **RETENTION.gauges(), "openai": LLM.stats()}
+
+@app.get("/livez")
+def livez():
+    # The process is up and serving; restart it only when this fails
     return {"status": "ok"}
 
+@app.get("/readyz")
+def readyz():
+    # Ready for traffic: warm-up finished, the menu store answers and the model is configured.
+    # An open circuit does not make a worker unready; every worker shares the same upstream.
+    checks: Dict[str, Any] = {"warmup": WARMUP["status"]}
+    ready = WARMUP["status"] in ("done", "disabled")
+    try:
+        STORE.get("readyz")
+        checks["store"] = "ok"
+    except Exception as e:
+        checks["store"] = f"failed: {e}"
+        ready = False
+    if AI_MODE == "real" and not OPENAI_API_KEY:
+        checks["openai"] = "OPENAI_API_KEY is missing"
+        ready = False
+    return JSONResponse({"status": "ready" if ready else "not_ready", "checks": checks}, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+def metrics(format: str = "json"):
+    # Stage latency histograms, token counters, cache hit rates and gauges for this worker.
+    # ?format=prometheus returns the Prometheus text exposition format.
+    caches = {"answer": ANSWER_CACHE.stats()}
+    if PARSE_CACHE is not None:
+        caches["parse"] = PARSE_CACHE.stats()
+    if format == "prometheus":
+        retention = RETENTION.gauges()
+        gauges = {f"{name}_cache_{k}": v for name, stats in caches.items() for k, v in stats.items()}
+        gauges.update({f"retention_{k}": v for k, v in retention.items() if isinstance(v, (int, float))})
+        gauges.update({f"parse_jobs_{k}": v for k, v in PARSE_JOBS.stats().items()})
+        gauges["openai_circuit_open"] = int(LLM.unavailable())
+        gauges["openai_retries"] = LLM.retries_total
+        return PlainTextResponse(METRICS.render_prometheus(gauges), media_type="text/plain; version=0.0.4")
+    return {
+        **METRICS.snapshot(),
+        "caches": caches,
+        "retention": RETENTION.gauges(),
+        "parse_jobs": PARSE_JOBS.stats(),
+        "openai": LLM.stats(),
+    }
+
+# Stops oversized uploads while the body is still arriving; 64 KB covers the multipart framing
+app.add_middleware(UploadSizeLimit, path="/menus/upload", max_bytes=MAX_UPLOAD_BYTES + 64 * 1024,
+                   detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+# Added last so it is outermost: responses from the middleware above (an early 413) get CORS headers too
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
 @app.post("/menus/upload")
-async def upload_menu(file: UploadFile = File(...)):
-    print(f"\n{'='*60}")
-    print(f"📤 MENU UPLOAD REQUEST")
-    print(f"{'='*60}")
-    print(f"📁 Filename: {file.filename}")
-    print(f"📏 Content type: {file.content_type}")
-    
+async def upload_menu(file: UploadFile = File(...), previous_menu_id: Optional[str] = Form(None)):
+    # previous_menu_id marks this upload as a revision: unchanged pages reuse that menu's parse
+    if previous_menu_id and not await asyncio.to_thread(STORE.get, previous_menu_id):
+        raise HTTPException(status_code=404, detail="previous_menu_id not found")
     menu_id = str(uuid.uuid4())
-    data = await file.read()
-    ext = os.path.splitext(file.filename or "")[1].lower()
-    
-    print(f"🆔 Generated menu_id: {menu_id}")
-    print(f"📄 File extension: {ext}")
-    print(f"📊 File size: {len(data)} bytes")
-    
-    if ext not in [".jpg",".jpeg",".png",".pdf"]:
-        print(f"❌ Unsupported file type: {ext}")
-        raise HTTPException(status_code=400, detail="Only JPG/PNG/PDF supported")
-    
-    save_path = os.path.join(TMP, f"{menu_id}{ext}")
-    save_bytes(save_path, data)
-    MENUS[menu_id] = {"path": save_path}
+    try:
+        with METRICS.timer("upload_write"):
+            stored = await stream_to_disk(file, TMP, menu_id, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_BYTES)
+    except UploadRejected as e:
+        log.info("upload rejected", extra={"upload_name": file.filename, "detail": e.detail})
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     
-    print(f"✅ File saved to: {save_path}")
-    print(f"📋 Total menus in memory: {len(MENUS)}")
+    duplicate_of = await asyncio.to_thread(STORE.find_by_sha256, stored.sha256)
+    await asyncio.to_thread(STORE.create, menu_id, stored.path, stored.sha256, stored.size, file.filename, previous_menu_id)
+    if await asyncio.to_thread(RETENTION.over_budget):
+        await asyncio.to_thread(RETENTION.sweep)
+    log.info("menu uploaded", extra={"menu_id": menu_id, "type": stored.ext, "bytes": stored.size})
     
-    return {"menu_id": menu_id, "filename": file.filename}
+    response = {"menu_id": menu_id, "filename": file.filename, "sha256": stored.sha256, "bytes": stored.size}
+    if duplicate_of:
+        response["duplicate_of"] = duplicate_of
+    if previous_menu_id:
+        response["previous_menu_id"] = previous_menu_id
+    return response
 
 class ParseRequest(BaseModel):
+    # Parsing no longer depends on the diner; if allergies are given the response
+    # also carries their overlay (same as POST /menus/{menu_id}/overlay).
     allergies: List[str] = []
 
 @app.post("/menus/{menu_id}/parse")
-def parse_menu(menu_id: str, request: ParseRequest):
-    print(f"\n{'='*60}")
-    print(f"🔍 MENU PARSE REQUEST")
-    print(f"{'='*60}")
-    print(f"🆔 Menu ID: {menu_id}")
-    print(f"🚨 User Allergies: {request.allergies if request.allergies else 'None specified'}")
-    
-    info = MENUS.get(menu_id)
+async def parse_menu(menu_id: str, request: Optional[ParseRequest] = None, background: bool = False):
+    # background=true queues a parse job and returns its id right away (202)
+    request = request or ParseRequest()
+    info = await asyncio.to_thread(STORE.get, menu_id)
     if not info:
-        print(f"❌ Menu not found in memory")
         raise HTTPException(status_code=404, detail="menu_id not found; upload first")
     
+    if background:
+        try:
+            job = PARSE_JOBS.submit(menu_id)
+        except QueueFull as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        log.info("parse job queued", extra={"menu_id": menu_id, "job_id": job.id})
+        return JSONResponse(status_code=202, content={
+            "menu_id": menu_id,
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"/jobs/{job.id}",
+            "events_url": f"/jobs/{job.id}/events",
+            "menu_status_url": f"/menus/{menu_id}/status",  # store-backed: answers from any worker
+        })
+
     path = info["path"]
-    print(f"📁 File path: {path}")
-    print(f"📄 File exists: {os.path.exists(path)}")
-    
-    parsed_pages: List[Dict[str, Any]] = []
+    await asyncio.to_thread(STORE.set_status, menu_id, "parsing")
+    try:
+        matcher = await previous_version_matcher(info)
+        parsed_pages, failed_pages, prints = await parse_pages(page_source(path), matcher=matcher)
+    except BaseException as e:
+        error = mark_parse_failed(menu_id, e)
+        if isinstance(e, (HTTPException, UpstreamError)) or not isinstance(e, Exception):
+            raise
+        raise HTTPException(status_code=500, detail=f"menu could not be parsed: {error}") from e
+    if not parsed_pages:
+        await asyncio.to_thread(STORE.set_status, menu_id, "failed", "all pages failed to parse")
+        if LLM.unavailable():
+            raise UpstreamError(503, "Model service temporarily unavailable", retry_after=LLM.breaker.retry_after())
+        raise HTTPException(status_code=502, detail={"message": "all pages failed to parse", "failed_pages": failed_pages})
 
-    if path.lower().endswith(".pdf"):
-        print(f"📖 Processing PDF file...")
-        images = pdf_to_images(path)
-        print(f"📄 PDF has {len(images)} pages")
-        for i, img_bytes in enumerate(images, start=1):
-            print(f"🔄 Processing page {i}/{len(images)}")
-            parsed_pages.append(call_o4mini_parse(img_bytes, page_no=i, user_allergies=request.allergies))
-    else:
-        print(f"🖼️  Processing image file...")
-        with open(path, "rb") as f:
-            img_bytes = f.read()
-        print(f"📊 Image size: {len(img_bytes)} bytes")
-        parsed_pages.append(call_o4mini_parse(img_bytes, page_no=1, user_allergies=request.allergies))
-
-    MENUS[menu_id]["parsed"] = parsed_pages
-    cache_file = os.path.join(TMP, f"{menu_id}_parsed.json")
-    with open(cache_file, "w") as f:
-        json.dump(parsed_pages, f)
-    
-    print(f"✅ Parsing complete!")
-    print(f"📋 Total pages parsed: {len(parsed_pages)}")
-    print(f"💾 Cached to: {cache_file}")
+    await store_parse_results(menu_id, parsed_pages, "partial" if failed_pages else "parsed", prints)
     
-    return {"menu_id": menu_id, "pages": len(parsed_pages), "status": "parsed"}
+    response = {"menu_id": menu_id, "pages": len(parsed_pages), "status": "parsed"}
+    if failed_pages:
+        response["status"] = "partial"
+        response["failed_pages"] = failed_pages
+    if matcher is not None:
+        response["reused_pages"] = [{"page": fp["page"], "from_page": fp["reused_from"]} for fp in prints if "reused_from" in fp]
+    if request.allergies:
+        response["overlay"] = overlay_profile(parsed_pages, request.allergies)
+    return response
+
+def mark_parse_failed(menu_id: str, e: BaseException) -> str:
+    # A parse that raised must not stay "parsing": retention never evicts those rows.
+    # Synchronous on purpose, so it still runs when the task is being cancelled.
+    error = str(e.detail if isinstance(e, HTTPException) else e) or type(e).__name__
+    STORE.set_status(menu_id, "failed", error)
+    log.warning("parse failed", extra={"menu_id": menu_id, "error": error})
+    return error
+
+async def previous_version_matcher(info: Dict[str, Any]) -> Optional[PageMatcher]:
+    previous = info.get("previous_menu_id")
+    if not previous:
+        return None
+    pages = await asyncio.to_thread(STORE.get_pages, previous)
+    prints = await asyncio.to_thread(STORE.get_fingerprints, previous)
+    if not pages or not prints:
+        log.info("previous version has no fingerprints; full parse", extra={"menu_id": info["menu_id"], "previous_menu_id": previous})
+        return None
+    return PageMatcher(pages, prints, PAGE_MATCH_MAX_DISTANCE)
+
+async def store_parse_results(menu_id: str, parsed_pages: List[Dict[str, Any]], status: str = "parsed",
+                              fingerprints: Optional[List[Dict[str, Any]]] = None):
+    version = await asyncio.to_thread(STORE.set_parsed, menu_id, parsed_pages, status, fingerprints)
+    ANSWER_CACHE.invalidate(menu_id)
+    cache_view(menu_id, build_view(version, parsed_pages))
+    log.info("menu parsed", extra={"menu_id": menu_id, "pages": len(parsed_pages), "version": version, "status": status})
+
+# ---- Background parse jobs ----
+async def run_parse_job(job: ParseJob):
+    info = await asyncio.to_thread(STORE.get, job.menu_id)
+    if not info:
+        job.finish("failed", error="menu_id not found")
+        return
+    path = info["path"]
+    await asyncio.to_thread(STORE.set_status, job.menu_id, "parsing")
+    try:
+        total = await count_pages(path)
+        job.start(total)
+        matcher = await previous_version_matcher(info)
+        parsed_pages, failed_pages, prints = await parse_pages(page_source(path, total), on_page=job.page_done, matcher=matcher)
+    except BaseException as e:
+        job.finish("failed", error=mark_parse_failed(job.menu_id, e))
+        raise
+    if not parsed_pages:
+        await asyncio.to_thread(STORE.set_status, job.menu_id, "failed", "all pages failed to parse")
+        job.finish("failed", error="all pages failed to parse")
+        return
+    status = "partial" if failed_pages else "parsed"
+    await store_parse_results(job.menu_id, parsed_pages, status, prints)
+    job.finish(status)
+
+# Jobs live in the worker that accepted them: /jobs/{id} and its events 404 on other workers, and
+# per-menu dedupe doesn't span workers. Multi-worker deployments need sticky routing for /jobs/*,
+# or clients poll menu_status_url, which reads the shared store.
+PARSE_JOBS = JobQueue(
+    run_parse_job,
+    workers=max(1, int(os.getenv("PARSE_JOB_WORKERS", "2"))),
+    max_pending=int(os.getenv("PARSE_JOB_MAX_PENDING", "100")),
+)
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    # Finished pages are included as soon as they land, before the whole job completes
+    job = PARSE_JOBS.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job_id not found")
+    return job.snapshot()
+
+@app.get("/jobs/{job_id}/events")
+def job_events(job_id: str):
+    job = PARSE_JOBS.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job_id not found")
+    return StreamingResponse(
+        job.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/menus/{menu_id}/status")
+def menu_status(menu_id: str):
+    # Parse status from the shared store, visible from every worker
+    record = STORE.get(menu_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="menu_id not found")
+    return {k: record[k] for k in ("menu_id", "status", "error", "version", "bytes", "filename", "previous_menu_id", "created_at", "updated_at")}
+
+# ---- Menu reads ----
+# Parsed pages as stored (PARSE_SCHEMA), or columnar with ?format=columnar. Bodies carry a strong
+# ETag and are compressed per Accept-Encoding; clients keep a copy and revalidate with
+# If-None-Match, getting a 304 until the menu is parsed again.
+MENU_CACHE_CONTROL = "private, no-cache"
+
+def menu_body(menu_id: str, view: MenuView, format: str, page_no: Optional[int] = None) -> EncodedBody:
+    key = (format, page_no)
+    encoded = view.wire.get(key)
+    if encoded is None:
+        head = {"menu_id": menu_id, "version": view.version, "format": format}
+        if page_no is None:
+            payload = {**head, "pages": encode_pages(view.pages, format)}
+        else:
+            page = next((p for p in view.pages if p.get("page") == page_no), None)
+            if page is None:
+                raise HTTPException(status_code=404, detail=f"page {page_no} not found")
+            payload = {**head, **encode_pages([page], format)[0]}
+        encoded = view.wire[key] = EncodedBody(payload)
+    return encoded
+
+def conditional_response(request: Request, encoded: EncodedBody) -> Response:
+    body, coding, etag = encoded.variant(request.headers.get("accept-encoding"))
+    headers = {"ETag": etag, "Cache-Control": MENU_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), encoded.etag):
+        METRICS.inc("menu_reads.not_modified")
+        return Response(status_code=304, headers=headers)
+    METRICS.inc("menu_reads.full")
+    if coding:
+        headers["Content-Encoding"] = coding
+    return Response(body, media_type="application/json", headers=headers)
+
+@app.get("/menus/{menu_id}")
+def get_menu(menu_id: str, request: Request, format: Literal["json", "columnar"] = "json"):
+    view = require_view(menu_id)
+    return conditional_response(request, menu_body(menu_id, view, format))
+
+@app.get("/menus/{menu_id}/pages/{page_no}")
+def get_menu_page(menu_id: str, page_no: int, request: Request, format: Literal["json", "columnar"] = "json"):
+    view = require_view(menu_id)
+    return conditional_response(request, menu_body(menu_id, view, format, page_no))
+
+@app.post("/menus/{menu_id}/overlay")
+def menu_overlay(menu_id: str, profile: Profile):
+    view = require_view(menu_id)
+    return {"menu_id": menu_id, **overlay_profile(view.pages, profile.allergens, profile.diets)}
+
+class SafeItemsRequest(BaseModel):
+    profiles: List[Profile]
+
+@app.post("/menus/{menu_id}/safe-items")
+def safe_items(menu_id: str, request: SafeItemsRequest):
+    # One entry per profile, in request order (e.g. every diner at a table)
+    matrix = require_view(menu_id).matrix
+    return {
+        "menu_id": menu_id,
+        "items": len(matrix),
+        "results": [matrix.filter(p.allergens, p.diets) for p in request.profiles],
+    }
 
 @app.post("/qa", response_model=QAResponse)
 def qa(req: QARequest):
-    print(f"\n{'='*60}")
-    print(f"❓ Q&A REQUEST")
-    print(f"{'='*60}")
-    print(f"🆔 Menu ID: {req.menu_id}")
-    print(f"❓ Question: {req.question}")
-    print(f"👤 Profile: {req.profile.model_dump()}")
-    
-    info = MENUS.get(req.menu_id)
-    if not info or "parsed" not in info:
-        print(f"❌ Menu not found or not parsed")
-        raise HTTPException(status_code=400, detail="Menu not parsed yet. Call /menus/{id}/parse first.")
-    
-    parsed_pages = info["parsed"]
-    print(f"📄 Using {len(parsed_pages)} parsed pages for analysis")
-    
-    result = call_o4mini_answer(parsed_pages, req.profile, req.question)
-    
-    print(f"✅ Q&A analysis complete!")
-    print(f"🎯 Final result: {result.get('result', 'unknown')}")
-    
-    return QAResponse(**result)
+    with METRICS.timer("qa"):
+        view = require_view(req.menu_id)
+        answer, cache_key = answer_fast(req.menu_id, view, req.question, req.profile)
+        if answer is not None:
+            return answer
+
+        result = call_o4mini_answer(view.index, req.profile, req.question)
+        METRICS.inc("qa_answers.model")
+        log.info("answered by model", extra={"menu_id": req.menu_id, "result": result.get("result")})
+        return remember_answer(cache_key, result)
+
+# SSE event per streamed field: the verdict first, then each reason/alternative/citation as it completes
+QA_STREAM_EVENTS = {"result": "verdict", "reasons": "reason", "alternatives": "alternative", "citations": "citation", "summary": "summary"}
+
+@app.post("/qa/stream")
+async def qa_stream(req: QARequest):
+    # Same answer as /qa, delivered as Server-Sent Events while the model is still writing it:
+    # verdict, reason*, alternative*, citation*, summary, then "answer" with the validated QAResponse
+    view = await asyncio.to_thread(require_view, req.menu_id)
+    answer, cache_key = await asyncio.to_thread(answer_fast, req.menu_id, view, req.question, req.profile)
+    return StreamingResponse(
+        stream_answer(view, req, answer, cache_key),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def answer_events(answer: Dict[str, Any]) -> List[str]:
+    frames = [sse_event("verdict", {"result": answer["result"]})]
+    for key in ("reasons", "alternatives", "citations"):
+        frames += [sse_event(QA_STREAM_EVENTS[key], {"value": v}) for v in answer[key]]
+    frames.append(sse_event("summary", {"value": answer["summary"]}))
+    return frames
+
+async def stream_answer(view: MenuView, req: QARequest, answer: Optional[QAResponse], cache_key: tuple) -> AsyncIterator[str]:
+    start = time.perf_counter()
+    try:
+        if answer is None and AI_MODE == "mock":
+            answer = remember_answer(cache_key, await asyncio.to_thread(call_o4mini_answer, view.index, req.profile, req.question))
+        if answer is not None:
+            METRICS.observe("qa_stream.first_event", time.perf_counter() - start)
+            for frame in answer_events(answer.model_dump()):
+                yield frame
+            yield sse_event("answer", answer.model_dump())
+            return
+
+        sys, user = await asyncio.to_thread(qa_prompt, view.index, req.profile, req.question)
+        parser = JSONObjectStream()
+        first = True
+        async for chunk in LLM.astream(
+            estimated_tokens=estimate_tokens(sys) + estimate_tokens(user) + 800,
+            model=OPENAI_MODEL_TEXT,
+            messages=[
+                {"role": "system", "content": sys},
+                {"role": "user", "content": user},
+            ],
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "QAResponse", "schema": QA_SCHEMA, "strict": True},
+            },
+            temperature=0.2,
+        ):
+            if chunk.usage is not None:
+                record_usage("qa_stream", chunk)
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            for kind, key, value in parser.feed(chunk.choices[0].delta.content):
+                if kind == "item":
+                    yield sse_event(QA_STREAM_EVENTS[key], {"value": value})
+                elif key == "result":
+                    yield sse_event("verdict", {"result": value})
+                elif key == "summary":
+                    yield sse_event("summary", {"value": value})
+                if first:
+                    METRICS.observe("qa_stream.first_event", time.perf_counter() - start)
+                    first = False
+
+        answer = remember_answer(cache_key, parser.result())
+        METRICS.inc("qa_answers.model")
+        yield sse_event("answer", answer.model_dump())
+    except UpstreamError as e:
+        yield sse_event("error", {"status": e.status_code, "detail": e.detail, "retry_after": e.retry_after})
+    except (ValueError, TypeError) as e:
+        # Malformed JSON from the stream parser or an answer that fails QAResponse validation
+        # (pydantic's ValidationError is a ValueError): same error event as an upstream 502
+        yield sse_event("error", {"status": 502, "detail": f"Model returned an invalid answer: {e}", "retry_after": None})
+    finally:
+        METRICS.observe("qa_stream", time.perf_counter() - start)
+
+def answer_fast(menu_id: str, view: MenuView, question: str, profile: Profile) -> Tuple[Optional[QAResponse], tuple]:
+    # Answer cache, then the local rule engine; (None, key) means the model is needed
+    cache_key = AnswerCache.key(
+        menu_id, view.version, question,
+        canonical_profile(profile.allergens, profile.diets, profile.sodium_limit),
+    )
+    cached = ANSWER_CACHE.get(cache_key)
+    if cached is not None:
+        METRICS.inc("qa_answers.cache")
+        return cached, cache_key
+
+    if LOCAL_QA_ENABLED:
+        local, confidence = answer_locally(
+            view.qa_items, profile.allergens, profile.diets, question, profile.sodium_limit
+        )
+        if local is not None and confidence >= LOCAL_QA_MIN_CONFIDENCE:
+            METRICS.inc("qa_answers.local")
+            log.info("answered locally", extra={"menu_id": menu_id, "confidence": confidence, "result": local["result"]})
+            answer = QAResponse(**local)
+            ANSWER_CACHE.put(cache_key, answer)
+            return answer, cache_key
+        log.info("local engine not confident", extra={"menu_id": menu_id, "confidence": confidence})
+    return None, cache_key
+
+def remember_answer(cache_key: tuple, result: Dict[str, Any]) -> QAResponse:
+    answer = QAResponse(**result)
+    ANSWER_CACHE.put(cache_key, answer)
+    return answer
+
+class QABatchEntry(BaseModel):
+    question: str
+    profile: Profile
+
+class QABatchRequest(BaseModel):
+    menu_id: str
+    entries: List[QABatchEntry]
+
+class QABatchResponse(BaseModel):
+    results: List[QAResponse]
+
+@app.post("/qa/batch", response_model=QABatchResponse)
+async def qa_batch(req: QABatchRequest):
+    # Whole-table evaluation: local/cached answers first, the rest share as few model calls as possible
+    start = time.perf_counter()
+    view = await asyncio.to_thread(require_view, req.menu_id)
+    results: List[Optional[QAResponse]] = [None] * len(req.entries)
+    pending: List[Tuple[int, tuple]] = []  # (entry index, answer cache key)
+    for i, entry in enumerate(req.entries):
+        results[i], cache_key = answer_fast(req.menu_id, view, entry.question, entry.profile)
+        if results[i] is None:
+            pending.append((i, cache_key))
+
+    # Identical (question, profile) pairs are only asked once
+    unique: Dict[tuple, List[int]] = {}
+    for i, cache_key in pending:
+        unique.setdefault(cache_key, []).append(i)
+    keys = list(unique)
+    chunks = [keys[n:n + QA_BATCH_MAX_QUESTIONS] for n in range(0, len(keys), QA_BATCH_MAX_QUESTIONS)]
+    log.info("batch planned", extra={
+        "menu_id": req.menu_id,
+        "entries": len(req.entries),
+        "answered_fast": len(req.entries) - len(pending),
+        "model_questions": len(keys),
+        "model_calls": len(chunks),
+    })
+
+    async def run_chunk(chunk: List[tuple]):
+        batch = [(req.entries[unique[k][0]].question, req.entries[unique[k][0]].profile) for k in chunk]
+        answers = await asyncio.to_thread(call_o4mini_answer_batch, view.index, batch)
+        for k, result in zip(chunk, answers):
+            answer = remember_answer(k, result)
+            METRICS.inc("qa_answers.model")
+            for i in unique[k]:
+                results[i] = answer
+
+    await asyncio.gather(*(run_chunk(chunk) for chunk in chunks))
+    METRICS.observe("qa_batch", time.perf_counter() - start)
+    return QABatchResponse(results=results)
@@ -0,0 +1,114 @@
+# Per-menu item × label matrix, built once at parse time.
+#
+# Columns are PARSE_SCHEMA's icon labels; each row (item) is stored as bitmasks in flat
+# array('I') columns, so filtering a menu for a profile is a handful of integer ops per item.
+from array import array
+from typing import Any, Dict, List, Tuple
+
+from allergens import ICON_LABELS, DIET_LABELS, canonical_labels, is_meat, is_non_vegan_extra, item_tags
+
+BIT = {label: 1 << i for i, label in enumerate(ICON_LABELS)}
+DIET_MASK = sum(BIT[d] for d in DIET_LABELS)
+
+class MenuMatrix:
+    __slots__ = ("names", "pages", "bboxes", "contains", "asserted", "violates", "known")
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.pages = array("I")
+        self.bboxes = array("d")     # 4 floats per row
+        self.contains = array("I")   # allergen labels found in ingredients or icons
+        self.asserted = array("I")   # diet labels the menu asserts (icons)
+        self.violates = array("I")   # diet labels ruled out by ingredients (meat, dairy, ...)
+        self.known = array("B")      # 1 if the row has ingredients or icons to judge by
+
+    @classmethod
+    def build(cls, parsed_pages: List[Dict[str, Any]]) -> "MenuMatrix":
+        m = cls()
+        for i, page in enumerate(parsed_pages, start=1):
+            icons = page.get("icons") or []
+            for item in page.get("items") or []:
+                tags = item_tags(item, icons)
+                text = " ".join([item.get("name") or ""] + list(item.get("ingredients") or []))
+                contains = 0
+                for label in tags["allergens"]:
+                    contains |= BIT[label]
+                if "spicy" in tags["icons"]:
+                    contains |= BIT["spicy"]
+                asserted = 0
+                for label in tags["diets"]:
+                    asserted |= BIT[label]
+                violates = 0
+                if is_meat(text):
+                    violates |= BIT["vegetarian"] | BIT["vegan"]
+                if not asserted & BIT["vegan"] and (set(tags["allergens"]) & {"dairy", "egg"} or is_non_vegan_extra(text)):
+                    violates |= BIT["vegan"]
+                bbox = list(item.get("bbox") or [])[:4]
+                m.names.append(item.get("name") or "Unnamed item")
+                m.pages.append(int(page.get("page") or i))
+                m.bboxes.extend([float(v) for v in bbox] + [0.0] * (4 - len(bbox)))
+                m.contains.append(contains)
+                m.asserted.append(asserted)
+                m.violates.append(violates)
+                m.known.append(1 if item.get("ingredients") or tags["icons"] else 0)
+        return m
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @staticmethod
+    def profile_masks(allergens: List[str], diets: List[str]) -> Tuple[int, int, List[str]]:
+        avoid = need = 0
+        unrecognized = []
+        for term in allergens:
+            bits = [BIT[l] for l in canonical_labels(term) if l in BIT and not BIT[l] & DIET_MASK]
+            for bit in bits:
+                avoid |= bit
+            if not bits:
+                unrecognized.append(term)
+        for term in diets:
+            # Diets are asserted by the menu; "X-free" diets map to allergen labels to avoid
+            bits = [BIT[l] for l in canonical_labels(term) if l in BIT]
+            for bit in bits:
+                if bit & DIET_MASK:
+                    need |= bit
+                else:
+                    avoid |= bit
+            if not bits:
+                unrecognized.append(term)
+        return avoid, need, unrecognized
+
+    def classify(self, avoid: int, need: int) -> Tuple[List[int], List[int], List[int]]:
+        # Row indices → (safe, unsafe, unknown)
+        safe, unsafe, unknown = [], [], []
+        contains, asserted, violates, known = self.contains, self.asserted, self.violates, self.known
+        for i in range(len(self.names)):
+            if contains[i] & avoid or violates[i] & need:
+                unsafe.append(i)
+            elif not known[i] or (need & ~asserted[i]):
+                unknown.append(i)
+            else:
+                safe.append(i)
+        return safe, unsafe, unknown
+
+    def row(self, i: int) -> Dict[str, Any]:
+        return {
+            "name": self.names[i],
+            "page": self.pages[i],
+            "bbox": list(self.bboxes[4 * i:4 * i + 4]),
+            "labels": [label for label, bit in BIT.items() if (self.contains[i] | self.asserted[i]) & bit],
+        }
+
+    def filter(self, allergens: List[str], diets: List[str]) -> Dict[str, Any]:
+        avoid, need, unrecognized = self.profile_masks(allergens, diets)
+        safe, unsafe, unknown = self.classify(avoid, need)
+        if unrecognized:
+            # No column for it, so nothing can be confirmed safe
+            unknown = sorted(unknown + safe)
+            safe = []
+        return {
+            "safe": [self.row(i) for i in safe],
+            "unsafe": [self.row(i) for i in unsafe],
+            "unknown": [self.row(i) for i in unknown],
+            "unrecognized": unrecognized,
+        }
@@ -0,0 +1,130 @@
+# Wire encodings for GET /menus/{id}: plain or columnar JSON, strong ETags and gzip/br.
+#
+# The columnar format turns each page's list of objects into one list per field, dictionary-
+# encodes repeated strings (sections, icon labels) and flattens bboxes into [x1, y1, x2, y2, ...]
+# rounded to whole pixels, which makes the JSON roughly a third smaller before compression:
+#   {"page": 1,
+#    "items": {"n": 2, "name": [...], "ingredients": [[...], [...]], "price": [14.99, null],
+#              "sections": ["Salads"], "section": [0, null], "bbox": [100, 100, 300, 150, ...]},
+#    "icons": {"n": 1, "labels": ["peanut"], "label": [0], "confidence": [0.9], "bbox": [...]},
+#    "tables": [...]}  # unchanged
+import gzip
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except Exception:
+    BROTLI_AVAILABLE = False
+
+MIN_COMPRESS_BYTES = 1024  # smaller bodies go out uncompressed
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+def _flat_bboxes(entries: List[Dict[str, Any]]) -> List[int]:
+    flat: List[int] = []
+    for e in entries:
+        bbox = e.get("bbox") or [0, 0, 0, 0]
+        flat.extend(round(v) for v in bbox[:4])
+    return flat
+
+def _dictionary(values: List[Optional[str]]) -> Tuple[List[str], List[Optional[int]]]:
+    table: Dict[str, int] = {}
+    codes = [None if v is None else table.setdefault(v, len(table)) for v in values]
+    return list(table), codes
+
+def columnar_page(page: Dict[str, Any]) -> Dict[str, Any]:
+    items = page.get("items") or []
+    icons = page.get("icons") or []
+    sections, section_codes = _dictionary([i.get("section") for i in items])
+    labels, label_codes = _dictionary([i.get("label") for i in icons])
+    return {
+        "page": page.get("page"),
+        "items": {
+            "n": len(items),
+            "name": [i.get("name", "") for i in items],
+            "ingredients": [i.get("ingredients") or [] for i in items],
+            "price": [i.get("price") for i in items],
+            "sections": sections,
+            "section": section_codes,
+            "bbox": _flat_bboxes(items),
+        },
+        "icons": {
+            "n": len(icons),
+            "labels": labels,
+            "label": label_codes,
+            "confidence": [i.get("confidence") for i in icons],
+            "bbox": _flat_bboxes(icons),
+        },
+        "tables": page.get("tables") or [],
+    }
+
+def encode_pages(pages: List[Dict[str, Any]], format: str) -> List[Dict[str, Any]]:
+    if format == "columnar":
+        return [columnar_page(p) for p in pages]
+    return pages
+
+def dumps(payload: Any) -> bytes:
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def strong_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # The compressed variants carry the identity ETag plus "-gzip"/"-br"; any of them matches
+    if not if_none_match:
+        return False
+    base = etag.strip('"')
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        tag = candidate.strip('"')
+        if tag == base or tag in (f"{base}-gzip", f"{base}-br"):
+            return True
+    return False
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    # br when the client takes it and brotli is installed, then gzip; q=0 refuses a coding
+    offered: Dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            offered[name.strip().lower()] = q
+    wildcard = offered.get("*", 0.0)
+    for coding in (("br",) if BROTLI_AVAILABLE else ()) + ("gzip",):
+        if offered.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+class EncodedBody:
+    # One JSON representation and its compressed variants, built lazily and kept for reuse
+    def __init__(self, payload: Any):
+        self.body = dumps(payload)
+        self.etag = strong_etag(self.body)
+        self._compressed: Dict[str, bytes] = {}
+
+    def variant(self, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str], str]:
+        # (body, Content-Encoding or None, ETag of that representation)
+        coding = choose_encoding(accept_encoding) if len(self.body) >= MIN_COMPRESS_BYTES else None
+        if coding is None:
+            return self.body, None, self.etag
+        if coding not in self._compressed:
+            self._compressed[coding] = compress(self.body, coding)
+        return self._compressed[coding], coding, f'{self.etag[:-1]}-{coding}"'
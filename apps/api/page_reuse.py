@@ -0,0 +1,55 @@
+# Incremental re-parse: fingerprints for every parsed page, and a matcher that finds the page
+# of a previous menu version whose content is unchanged, so its stored parse can be reused.
+#
+# A page matches when the SHA-256 of its normalized image is identical. Perceptual matching, within
+# `max_distance` bits of the 32×32 dHash at the same original size, is opt-in (max_distance >= 0):
+# it forgives the pixel noise of re-exported PDFs, but a one-word ingredient edit ("herbs" →
+# "pesto") leaves the thumbnail, and so the hash, unchanged even at distance 0, and the stale
+# parse would miss the new allergen. The default of -1 reuses pages on exact bytes only.
+import copy
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from imaging import NormalizedImage
+
+Fingerprint = Dict[str, Any]  # page, sha256, dhash (hex), size [w, h]
+
+def fingerprint(page_no: int, norm: NormalizedImage) -> Fingerprint:
+    return {
+        "page": page_no,
+        "sha256": hashlib.sha256(norm.data).hexdigest(),
+        "dhash": format(norm.dhash, "x"),
+        "size": list(norm.original_size),
+    }
+
+class PageMatcher:
+    def __init__(self, pages: List[Dict[str, Any]], fingerprints: List[Fingerprint], max_distance: int = -1):
+        self.max_distance = max_distance
+        self._by_sha: Dict[str, Tuple[Fingerprint, Dict[str, Any]]] = {}
+        self._candidates: List[Tuple[int, Tuple[int, int], Fingerprint, Dict[str, Any]]] = []
+        for fp, page in zip(fingerprints, pages):
+            self._by_sha.setdefault(fp["sha256"], (fp, page))
+            self._candidates.append((int(fp["dhash"], 16), tuple(fp["size"]), fp, page))
+
+    def __len__(self) -> int:
+        return len(self._candidates)
+
+    def match(self, fp: Fingerprint) -> Optional[Tuple[int, Dict[str, Any]]]:
+        # (previous page number, a copy of its parse renumbered to fp["page"]) or None
+        hit = self._by_sha.get(fp["sha256"])
+        if hit is None and self.max_distance >= 0:
+            bits, size = int(fp["dhash"], 16), tuple(fp["size"])
+            best = None
+            for other_bits, other_size, other_fp, page in self._candidates:
+                if other_size != size:
+                    continue
+                distance = (bits ^ other_bits).bit_count()
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, (other_fp, page))
+            hit = best[1] if best else None
+        if hit is None:
+            return None
+        prev_fp, page = hit
+        reused = copy.deepcopy(page)
+        reused["page"] = fp["page"]
+        return prev_fp["page"], reused
@@ -0,0 +1,124 @@
+# Menu retention: TTL + LRU eviction against a menu-count and byte budget, and a sweeper that
+# removes upload files no menu refers to any more. Keeps a long-running API at a stable
+# memory and disk footprint.
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from store import MenuStore
+
+log = logging.getLogger("allerlens.retention")
+
+# Files this API writes into its data directory: uploads, in-flight uploads, legacy parse dumps
+MENU_FILE = re.compile(r"^\.?([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(\.jpg|\.png|\.pdf|\.part|_parsed\.json)$")
+
+class Retention:
+    def __init__(self, store: MenuStore, directory: str, ttl_seconds: float, max_menus: int, max_bytes: int,
+                 on_evict: Optional[Callable[[str], None]] = None, orphan_grace_seconds: float = 600.0):
+        self.store = store
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_menus = max_menus
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self.evicted_total = 0
+        self.orphans_removed_total = 0
+        self.last_sweep: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def over_budget(self) -> bool:
+        count, total = self.store.usage()
+        return count > self.max_menus or total > self.max_bytes
+
+    def evict(self, menu_id: str) -> bool:
+        record = self.store.delete(menu_id)
+        if record is None:
+            return False
+        try:
+            os.unlink(record["path"])
+        except FileNotFoundError:
+            pass
+        if self.on_evict:
+            self.on_evict(menu_id)
+        self.evicted_total += 1
+        return True
+
+    def sweep(self, now: Optional[float] = None) -> Dict[str, int]:
+        with self._lock:
+            now = now or time.time()
+            records = self.store.records()
+            expired = [r for r in records if r["accessed_at"] + self.ttl_seconds < now]
+            for r in expired:
+                self.evict(r["menu_id"])
+            expired_ids = {r["menu_id"] for r in expired}
+            live = [r for r in records if r["menu_id"] not in expired_ids]
+
+            # LRU down to budget; menus mid-parse are left alone
+            live.sort(key=lambda r: r["accessed_at"])
+            count = len(live)
+            total = sum(r["bytes"] for r in live)
+            lru = 0
+            for r in live:
+                if count <= self.max_menus and total <= self.max_bytes:
+                    break
+                if r["status"] == "parsing":
+                    continue
+                if self.evict(r["menu_id"]):
+                    lru += 1
+                    count -= 1
+                    total -= r["bytes"]
+
+            orphans = self._remove_orphans(now)
+            self.last_sweep = now
+            return {"expired": len(expired), "lru": lru, "orphans": orphans}
+
+    def _remove_orphans(self, now: float) -> int:
+        known = {r["menu_id"] for r in self.store.records()}
+        removed = 0
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            m = MENU_FILE.match(entry.name)
+            if not m:
+                continue
+            legacy_dump = m.group(2) == "_parsed.json"  # parsed pages now live in the store
+            if m.group(1) in known and not legacy_dump:
+                continue
+            try:
+                if entry.stat().st_mtime + self.orphan_grace_seconds > now:
+                    continue  # may be an upload that hasn't been registered yet
+                os.unlink(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        self.orphans_removed_total += removed
+        return removed
+
+    def gauges(self) -> Dict[str, Any]:
+        count, total = self.store.usage()
+        return {
+            "menus": count,
+            "bytes": total,
+            "max_menus": self.max_menus,
+            "max_bytes": self.max_bytes,
+            "evicted_total": self.evicted_total,
+            "orphans_removed_total": self.orphans_removed_total,
+            "last_sweep": self.last_sweep,
+        }
+
+    async def run(self, interval_seconds: float) -> None:
+        while True:
+            try:
+                result = await asyncio.to_thread(self.sweep)
+                if any(result.values()):
+                    log.info("retention sweep", extra=result)
+            except Exception:
+                log.exception("retention sweep failed")
+            await asyncio.sleep(interval_seconds)
@@ -0,0 +1,238 @@
+# Menu storage backends: upload metadata, parsed pages and parse status.
+#
+# MemoryMenuStore keeps everything in the process (single worker, lost on restart).
+# SQLiteMenuStore uses one WAL-mode database file, so every uvicorn worker and every restart
+# sees the same menus.
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+# Record fields (parsed pages are only loaded by get_pages, their fingerprints by get_fingerprints):
+#   menu_id, path, sha256, bytes, filename, previous_menu_id, status, error, version,
+#   created_at, updated_at, accessed_at
+MenuRecord = Dict[str, Any]
+
+class MenuStore(ABC):
+    # previous_menu_id links a revised upload to the version it replaces (see page_reuse.py)
+    @abstractmethod
+    def create(self, menu_id: str, path: str, sha256: str, size: int, filename: Optional[str],
+               previous_menu_id: Optional[str] = None) -> MenuRecord: ...
+
+    @abstractmethod
+    def get(self, menu_id: str) -> Optional[MenuRecord]: ...
+
+    @abstractmethod
+    def get_pages(self, menu_id: str) -> Optional[List[Dict[str, Any]]]: ...
+
+    # One fingerprint per stored page, in the same order
+    @abstractmethod
+    def get_fingerprints(self, menu_id: str) -> Optional[List[Dict[str, Any]]]: ...
+
+    @abstractmethod
+    def find_by_sha256(self, sha256: str) -> Optional[str]: ...
+
+    @abstractmethod
+    def set_status(self, menu_id: str, status: str, error: Optional[str] = None) -> None: ...
+
+    # Stores parsed pages (and their fingerprints) and returns the menu's new parse version
+    @abstractmethod
+    def set_parsed(self, menu_id: str, pages: List[Dict[str, Any]], status: str = "parsed",
+                   fingerprints: Optional[List[Dict[str, Any]]] = None) -> int: ...
+
+    @abstractmethod
+    def touch(self, menu_id: str) -> None: ...
+
+    @abstractmethod
+    def delete(self, menu_id: str) -> Optional[MenuRecord]: ...
+
+    @abstractmethod
+    def records(self) -> List[MenuRecord]: ...
+
+    # (menu count, total upload bytes)
+    @abstractmethod
+    def usage(self) -> Tuple[int, int]: ...
+
+class MemoryMenuStore(MenuStore):
+    def __init__(self):
+        self._menus: Dict[str, MenuRecord] = {}
+        self._pages: Dict[str, List[Dict[str, Any]]] = {}
+        self._fingerprints: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, menu_id, path, sha256, size, filename, previous_menu_id=None):
+        now = time.time()
+        record = {
+            "menu_id": menu_id, "path": path, "sha256": sha256, "bytes": size, "filename": filename,
+            "previous_menu_id": previous_menu_id, "status": "uploaded", "error": None, "version": 0,
+            "created_at": now, "updated_at": now, "accessed_at": now,
+        }
+        with self._lock:
+            self._menus[menu_id] = record
+        return dict(record)
+
+    def get(self, menu_id):
+        with self._lock:
+            record = self._menus.get(menu_id)
+            return dict(record) if record else None
+
+    def get_pages(self, menu_id):
+        with self._lock:
+            return self._pages.get(menu_id)
+
+    def get_fingerprints(self, menu_id):
+        with self._lock:
+            return self._fingerprints.get(menu_id)
+
+    def find_by_sha256(self, sha256):
+        with self._lock:
+            matches = [r for r in self._menus.values() if r["sha256"] == sha256]
+        return min(matches, key=lambda r: r["created_at"])["menu_id"] if matches else None
+
+    def set_status(self, menu_id, status, error=None):
+        with self._lock:
+            record = self._menus.get(menu_id)
+            if record:
+                record.update(status=status, error=error, updated_at=time.time())
+
+    def set_parsed(self, menu_id, pages, status="parsed", fingerprints=None):
+        with self._lock:
+            record = self._menus[menu_id]
+            self._pages[menu_id] = pages
+            if fingerprints is not None:
+                self._fingerprints[menu_id] = fingerprints
+            else:
+                self._fingerprints.pop(menu_id, None)
+            record.update(status=status, error=None, version=record["version"] + 1, updated_at=time.time())
+            return record["version"]
+
+    def touch(self, menu_id):
+        with self._lock:
+            record = self._menus.get(menu_id)
+            if record:
+                record["accessed_at"] = time.time()
+
+    def delete(self, menu_id):
+        with self._lock:
+            self._pages.pop(menu_id, None)
+            self._fingerprints.pop(menu_id, None)
+            return self._menus.pop(menu_id, None)
+
+    def records(self):
+        with self._lock:
+            return [dict(r) for r in self._menus.values()]
+
+    def usage(self):
+        with self._lock:
+            return len(self._menus), sum(r["bytes"] for r in self._menus.values())
+
+class SQLiteMenuStore(MenuStore):
+    COLUMNS = ("menu_id, path, sha256, bytes, filename, previous_menu_id, status, error, version,"
+               " created_at, updated_at, accessed_at")
+    # Columns added after the first release; older databases get them on open
+    ADDED_COLUMNS = {"previous_menu_id": "TEXT", "fingerprints": "TEXT"}
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS menus ("
+                " menu_id TEXT PRIMARY KEY, path TEXT NOT NULL, sha256 TEXT, bytes INTEGER NOT NULL DEFAULT 0,"
+                " filename TEXT, status TEXT NOT NULL, error TEXT, version INTEGER NOT NULL DEFAULT 0,"
+                " parsed TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(menus)")}
+            for name, kind in self.ADDED_COLUMNS.items():
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE menus ADD COLUMN {name} {kind}")
+            conn.execute("CREATE INDEX IF NOT EXISTS menus_sha256 ON menus (sha256, created_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; `with conn:` wraps each write in a transaction
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+            self._local.conn = conn
+        return conn
+
+    def create(self, menu_id, path, sha256, size, filename, previous_menu_id=None):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO menus (menu_id, path, sha256, bytes, filename, previous_menu_id, status, version,"
+                " created_at, updated_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, 'uploaded', 0, ?, ?, ?)",
+                (menu_id, path, sha256, size, filename, previous_menu_id, now, now, now),
+            )
+        return self.get(menu_id)
+
+    def get(self, menu_id):
+        row = self._conn().execute(f"SELECT {self.COLUMNS} FROM menus WHERE menu_id = ?", (menu_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_pages(self, menu_id):
+        row = self._conn().execute("SELECT parsed FROM menus WHERE menu_id = ?", (menu_id,)).fetchone()
+        return json.loads(row["parsed"]) if row and row["parsed"] else None
+
+    def get_fingerprints(self, menu_id):
+        row = self._conn().execute("SELECT fingerprints FROM menus WHERE menu_id = ?", (menu_id,)).fetchone()
+        return json.loads(row["fingerprints"]) if row and row["fingerprints"] else None
+
+    def find_by_sha256(self, sha256):
+        row = self._conn().execute(
+            "SELECT menu_id FROM menus WHERE sha256 = ? ORDER BY created_at LIMIT 1", (sha256,)
+        ).fetchone()
+        return row["menu_id"] if row else None
+
+    def set_status(self, menu_id, status, error=None):
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE menus SET status = ?, error = ?, updated_at = ? WHERE menu_id = ?",
+                (status, error, time.time(), menu_id),
+            )
+
+    def set_parsed(self, menu_id, pages, status="parsed", fingerprints=None):
+        payload = json.dumps(pages, separators=(",", ":"))
+        prints = json.dumps(fingerprints, separators=(",", ":")) if fingerprints is not None else None
+        with self._conn() as conn:
+            row = conn.execute(
+                "UPDATE menus SET parsed = ?, fingerprints = ?, status = ?, error = NULL, version = version + 1,"
+                " updated_at = ? WHERE menu_id = ? RETURNING version",
+                (payload, prints, status, time.time(), menu_id),
+            ).fetchone()
+        if row is None:
+            raise KeyError(menu_id)
+        return row["version"]
+
+    def touch(self, menu_id):
+        with self._conn() as conn:
+            conn.execute("UPDATE menus SET accessed_at = ? WHERE menu_id = ?", (time.time(), menu_id))
+
+    def delete(self, menu_id):
+        with self._conn() as conn:
+            row = conn.execute(
+                f"DELETE FROM menus WHERE menu_id = ? RETURNING {self.COLUMNS}", (menu_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def records(self):
+        return [dict(r) for r in self._conn().execute(f"SELECT {self.COLUMNS} FROM menus")]
+
+    def usage(self):
+        count, total = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM menus").fetchone()
+        return count, total
+
+def open_store(kind: str, path: str) -> MenuStore:
+    if kind == "memory":
+        return MemoryMenuStore()
+    if kind == "sqlite":
+        return SQLiteMenuStore(path)
+    raise ValueError(f"unknown MENU_STORE {kind!r} (expected 'sqlite' or 'memory')")
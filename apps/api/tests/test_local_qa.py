@@ -0,0 +1,84 @@
+import pytest
+
+from local_qa import answer_locally, tag_items
+
+MIN_CONFIDENCE = 0.75  # main.LOCAL_QA_MIN_CONFIDENCE default
+
+# The mock parse from main.parse_page
+PAGES = [{
+    "page": 1,
+    "items": [
+        {
+            "name": "Grilled Chicken Caesar Salad",
+            "ingredients": ["chicken", "romaine lettuce", "parmesan cheese", "caesar dressing", "croutons"],
+            "price": 14.99, "section": "Salads", "bbox": [100, 100, 300, 150],
+        },
+        {
+            "name": "Peanut Butter Chocolate Cake",
+            "ingredients": ["flour", "sugar", "eggs", "peanut butter", "chocolate", "butter"],
+            "price": 8.99, "section": "Desserts", "bbox": [100, 200, 300, 250],
+        },
+    ],
+    "icons": [
+        {"label": "peanut", "bbox": [50, 200, 80, 230], "confidence": 0.9},
+        {"label": "dairy", "bbox": [50, 100, 80, 130], "confidence": 0.8},
+    ],
+    "tables": [],
+}]
+
+def ask(question, allergens=("peanut",), diets=(), sodium_limit=None):
+    return answer_locally(tag_items(PAGES), list(allergens), list(diets), question, sodium_limit)
+
+@pytest.mark.parametrize("question", [
+    "Is everything here safe for me?",
+    "Is this menu safe for my peanut allergy?",
+    "Does any dish contain peanuts?",
+    "Can I eat everything on the menu?",
+])
+def test_whole_menu_question_is_unsafe_when_any_item_conflicts(question):
+    answer, confidence = ask(question)
+    assert answer["result"] == "unsafe"
+    assert "Peanut Butter Chocolate Cake" in answer["summary"]
+    assert confidence >= MIN_CONFIDENCE
+
+@pytest.mark.parametrize("question", [
+    "What can I eat?",
+    "Which dishes are safe for me?",
+    "Is there anything I can order?",
+])
+def test_choice_question_is_safe_when_a_safe_item_exists(question):
+    answer, confidence = ask(question)
+    assert answer["result"] == "safe"
+    assert answer["alternatives"] == ["Grilled Chicken Caesar Salad"]
+    assert confidence >= MIN_CONFIDENCE
+
+@pytest.mark.parametrize("question", ["Anything safe here?", "Is there anything with peanut?"])
+def test_ambiguous_whole_menu_question_goes_to_the_model(question):
+    answer, confidence = ask(question)
+    assert answer["result"] == "unsafe"
+    assert confidence < MIN_CONFIDENCE
+
+def test_named_dish_is_judged_on_its_own():
+    answer, confidence = ask("Is the caesar salad safe for me?")
+    assert answer["result"] == "safe"
+    assert confidence >= MIN_CONFIDENCE
+    answer, _ = ask("Is the chocolate cake safe for me?")
+    assert answer["result"] == "unsafe"
+
+@pytest.mark.parametrize("diet", ["gluten-free", "dairy-free"])
+def test_free_from_diet_maps_to_its_allergen(diet):
+    answer, confidence = ask("Is the caesar salad safe for me?", allergens=(), diets=(diet,))
+    assert answer["result"] == "unsafe"
+    assert confidence >= MIN_CONFIDENCE
+
+def test_unrecognized_diet_goes_to_the_model():
+    answer, confidence = ask("Is the caesar salad safe for me?", diets=("halal",))
+    assert answer["result"] == "safe"
+    assert confidence < MIN_CONFIDENCE
+
+def test_sodium_limit_only_lets_conflicts_through():
+    _, confidence = ask("Is the caesar salad safe for me?", sodium_limit=600)
+    assert confidence < MIN_CONFIDENCE
+    answer, confidence = ask("Is the chocolate cake safe for me?", sodium_limit=600)
+    assert answer["result"] == "unsafe"
+    assert confidence >= MIN_CONFIDENCE
@@ -0,0 +1,143 @@
+# Merging the parses of overlapping tiles (see imaging.tile_boxes) back into one page.
+# Bboxes must already be in page coordinates. Anything in an overlap zone is reported by every
+# tile that sees it, possibly cut off at one tile's edge; such copies are folded together when
+# their boxes overlap (IoU, one box lying inside the other, or two pieces of one line meeting
+# across a seam) and, for items, their names match. A name longer than the overlap is split
+# between the two pieces ("Grilled salmon with" | "salmon with lemon butter"); at a seam those
+# match on their shared words and are joined back together.
+import re
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Tuple
+
+IOU_THRESHOLD = 0.5
+CONTAINMENT_THRESHOLD = 0.85  # share of the smaller box inside the larger: a copy clipped at a seam
+SEAM_THRESHOLD = 0.8  # 1-D IoU across the seam for two overlapping pieces of the same line or column
+NAME_THRESHOLD = 0.85
+
+Box = List[float]
+
+def _area(b: Box) -> float:
+    return max(0.0, b[2] - b[0]) * max(0.0, b[3] - b[1])
+
+def _intersection(a: Box, b: Box) -> float:
+    return _area([max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])])
+
+def iou(a: Box, b: Box) -> float:
+    inter = _intersection(a, b)
+    union = _area(a) + _area(b) - inter
+    return inter / union if union > 0 else 0.0
+
+def containment(a: Box, b: Box) -> float:
+    smaller = min(_area(a), _area(b))
+    return _intersection(a, b) / smaller if smaller > 0 else 0.0
+
+def _span_iou(a1: float, a2: float, b1: float, b2: float) -> float:
+    inter = max(0.0, min(a2, b2) - max(a1, b1))
+    union = max(a2, b2) - min(a1, b1)
+    return inter / union if union > 0 else 0.0
+
+def _valid(b: Optional[Box]) -> bool:
+    return bool(b) and len(b) == 4
+
+def across_seam(a: Optional[Box], b: Optional[Box]) -> bool:
+    # An entry wider (or taller) than the overlap is cut by the seam in both tiles
+    return _valid(a) and _valid(b) and _intersection(a, b) > 0 and max(
+        _span_iou(a[1], a[3], b[1], b[3]), _span_iou(a[0], a[2], b[0], b[2])
+    ) >= SEAM_THRESHOLD
+
+def same_place(a: Optional[Box], b: Optional[Box]) -> bool:
+    if not _valid(a) or not _valid(b):
+        return False
+    return iou(a, b) >= IOU_THRESHOLD or containment(a, b) >= CONTAINMENT_THRESHOLD or across_seam(a, b)
+
+def _norm_name(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", (name or "").lower()).strip()
+
+def same_name(a: str, b: str) -> bool:
+    # A name cut off at a tile edge is a prefix of the full one; a piece with no name left
+    # (only its price showed) belongs to whichever item occupies the same place
+    a, b = _norm_name(a), _norm_name(b)
+    if not a or not b:
+        return True
+    shorter, longer = sorted((a, b), key=len)
+    if len(shorter) >= 4 and longer.startswith(shorter):
+        return True
+    return SequenceMatcher(None, a, b).ratio() >= NAME_THRESHOLD
+
+def seam_join(first: str, second: str) -> Optional[str]:
+    # `first` + `second` with their shared words once, when the end of `first` is the start of
+    # `second`, e.g. "Grilled salmon with" + "salmon with lemon butter"
+    words_a, words_b = (first or "").split(), (second or "").split()
+    norm_a, norm_b = [_norm_name(w) for w in words_a], [_norm_name(w) for w in words_b]
+    for k in range(min(len(words_a), len(words_b)), 0, -1):
+        if norm_a[-k:] == norm_b[:k]:
+            return " ".join(words_a + words_b[k:])
+    return None
+
+def _reading_order(a: Dict[str, Any], b: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    return (a, b) if (a["bbox"][0], a["bbox"][1]) <= (b["bbox"][0], b["bbox"][1]) else (b, a)
+
+def _joined_name(a: Dict[str, Any], b: Dict[str, Any]) -> Optional[str]:
+    first, second = _reading_order(a, b)
+    return seam_join(first.get("name", ""), second.get("name", "")) or seam_join(second.get("name", ""), first.get("name", ""))
+
+def same_item(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    if same_name(a.get("name", ""), b.get("name", "")):
+        return True
+    return across_seam(a.get("bbox"), b.get("bbox")) and _joined_name(a, b) is not None
+
+def _union(a: Box, b: Box) -> Box:
+    return [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+
+def _merge_item(kept: Dict[str, Any], other: Dict[str, Any]) -> None:
+    # The larger box is the more complete copy; the other only fills gaps
+    if _area(other["bbox"]) > _area(kept["bbox"]):
+        base, extra = dict(other), kept
+    else:
+        base, extra = dict(kept), other
+    base["bbox"] = _union(kept["bbox"], other["bbox"])
+    if not same_name(kept.get("name", ""), other.get("name", "")):
+        base["name"] = _joined_name(kept, other) or base.get("name", "")
+    elif len(_norm_name(extra.get("name", ""))) > len(_norm_name(base.get("name", ""))):
+        base["name"] = extra["name"]
+    seen = {i.lower() for i in base.get("ingredients") or []}
+    missing = [i for i in extra.get("ingredients") or [] if i.lower() not in seen]
+    if missing:
+        base["ingredients"] = list(base.get("ingredients") or []) + missing
+    for key in ("price", "section"):
+        if base.get(key) is None and extra.get(key) is not None:
+            base[key] = extra[key]
+    kept.clear()
+    kept.update(base)
+
+def _merge_icon(kept: Dict[str, Any], other: Dict[str, Any]) -> None:
+    kept["bbox"] = _union(kept["bbox"], other["bbox"])
+    if "confidence" in other or "confidence" in kept:
+        kept["confidence"] = max(kept.get("confidence", 0), other.get("confidence", 0))
+
+def _merge_table(kept: Dict[str, Any], other: Dict[str, Any]) -> None:
+    if len(other.get("cells") or []) > len(kept.get("cells") or []):
+        kept["cells"] = other["cells"]
+    kept["bbox"] = _union(kept["bbox"], other["bbox"])
+
+def merge_tile_pages(page_no: int, tiles: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], int]:
+    # (one page parse, number of duplicate entries folded away)
+    page: Dict[str, Any] = {"page": page_no, "items": [], "icons": [], "tables": []}
+    merged = 0
+    rules = (
+        ("items", same_item, _merge_item),
+        ("icons", lambda a, b: a.get("label") == b.get("label"), _merge_icon),
+        ("tables", lambda a, b: True, _merge_table),
+    )
+    for key, matches, merge in rules:
+        kept: List[Dict[str, Any]] = page[key]
+        for tile in tiles:
+            own = len(kept)  # entries of one tile are never duplicates of each other
+            for entry in tile.get(key) or []:
+                dup = next((k for k in kept[:own] if matches(k, entry) and same_place(k.get("bbox"), entry.get("bbox"))), None)
+                if dup is None:
+                    kept.append(dict(entry))
+                else:
+                    merge(dup, entry)
+                    merged += 1
+    return page, merged
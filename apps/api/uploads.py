@@ -0,0 +1,109 @@
+# Streaming upload writer: chunks go straight to disk off the event loop, the content hash is
+# computed on the fly, and the file type comes from its magic bytes rather than its name.
+#
+# Starlette spools the whole multipart body (to a temp file past 1 MB) before the route sees an
+# UploadFile, so stream_to_disk's magic-byte and size checks run after the upload has arrived and
+# the file is written twice. What stops an oversized upload early is UploadSizeLimit: it refuses a
+# too-large Content-Length outright and cuts a chunked body off as soon as it passes the limit.
+import asyncio
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+MAGIC = [
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"%PDF-", ".pdf"),
+]
+MAX_MAGIC_LEN = max(len(m) for m, _ in MAGIC)
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class UploadSizeLimit:
+    # ASGI middleware for one upload path. `max_bytes` is the whole request body, so leave room
+    # for the multipart framing above the file limit.
+    def __init__(self, app, path: str, max_bytes: int, detail: str):
+        self.app = app
+        self.path = path
+        self.max_bytes = max_bytes
+        self.detail = detail
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            return await self.app(scope, receive, send)
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            return await JSONResponse(status_code=413, content={"detail": self.detail})(scope, receive, send)
+        received = 0
+
+        async def limited_receive():
+            # Raised while the form is being parsed; FastAPI passes HTTPExceptions from the body through
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=self.detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+@dataclass
+class StoredUpload:
+    path: str
+    ext: str
+    sha256: str
+    size: int
+
+def sniff_extension(head: bytes) -> Optional[str]:
+    for magic, ext in MAGIC:
+        if head.startswith(magic):
+            return ext
+    return None
+
+async def stream_to_disk(file, directory: str, stem: str, max_bytes: int, chunk_size: int = 1024 * 1024) -> StoredUpload:
+    # `file` is anything with an async read(n) (Starlette's UploadFile, already spooled). The upload
+    # lands in a temp file and is renamed once complete, so readers never see a partial menu.
+    head = await file.read(chunk_size)
+    while len(head) < MAX_MAGIC_LEN:
+        more = await file.read(chunk_size)
+        if not more:
+            break
+        head += more
+    ext = sniff_extension(head)
+    if ext is None:
+        raise UploadRejected(400, "Only JPG/PNG/PDF supported")
+
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".{stem}.part")
+    final_path = os.path.join(directory, f"{stem}{ext}")
+    hasher = hashlib.sha256()
+    size = 0
+    f = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        chunk = head
+        while chunk:
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadRejected(413, f"Upload exceeds {max_bytes} bytes")
+            hasher.update(chunk)
+            await asyncio.to_thread(f.write, chunk)
+            chunk = await file.read(chunk_size)
+        await asyncio.to_thread(f.close)
+        await asyncio.to_thread(os.replace, tmp_path, final_path)
+    except BaseException:
+        f.close()
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return StoredUpload(path=final_path, ext=ext, sha256=hasher.hexdigest(), size=size)